@@ -1,26 +1,70 @@
+import codecs
 import csv
+import gzip
 import io
 from decimal import Decimal
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterable, Iterator, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _as_currency(value: Any) -> Any:
+    """Formatea como moneda los valores numéricos; el resto se deja tal cual"""
+    if isinstance(value, (int, float)):
+        return f"${value:,.2f}"
+    return value
+
+
+def _profit_margin(budget: Dict[str, Any]) -> str:
+    """Margen de beneficio del presupuesto como porcentaje"""
+    total = budget.get('total_amount', 1)
+    profit = budget.get('profit_amount', 0)
+    value = (profit / total * 100) if total > 0 else 0
+    return f"{value:.1f}%"
+
+
+def _percentage(value: Any, total: Any) -> Any:
+    """Porcentaje de value sobre total (0 si el total es nulo); admite float y Decimal"""
+    return value / total * 100 if total else 0
+
+
+# Filas de la comparación de presupuestos: (concepto, extractor del valor ya formateado)
+_COMPARISON_ROWS = (
+    ('Subtotal', lambda budget: _as_currency(budget.get('total_amount', 0) - budget.get('profit_amount', 0))),
+    ('Beneficio', lambda budget: _as_currency(budget.get('profit_amount', 0))),
+    ('Total', lambda budget: _as_currency(budget.get('final_amount', 0))),
+    ('Margen de Beneficio (%)', _profit_margin),
+    ('Número de Partidas', lambda budget: len(budget.get('items', []))),
+    ('Fecha de Creación', lambda budget: budget.get('created_at', 'N/A')),
+)
+
+
 class CSVExporter:
     """Exporta datos a formato CSV"""
     
+    # Buffer de escritura (1 MiB) para agrupar las filas en pocas llamadas write()
+    BUFFER_SIZE = 1 << 20
+    
+    # Filas acumuladas antes de emitir cada fragmento en la exportación por streaming
+    flush_interval = 1000
+    
+    # Nivel gzip para exportaciones comprimidas: el más rápido, con buena compresión en CSV
+    COMPRESS_LEVEL = 1
+    
     def __init__(self):
         self.encoding = 'utf-8'
         self.delimiter = ','
     
-    def export_budget_to_csv(self, budget_data: Dict[str, Any], output_path: str) -> bool:
+    def export_budget_to_csv(self, budget_data: Dict[str, Any], output_path: str, compress: bool = False) -> bool:
         """
         Exporta un presupuesto a CSV
         
         Args:
             budget_data: Datos del presupuesto
             output_path: Ruta de salida
+            compress: Si comprimir la salida con gzip (p. ej. para rutas .csv.gz)
             
         Returns:
             True si se exportó exitosamente
@@ -28,16 +72,17 @@ class CSVExporter:
         try:
             logger.info(f"Exportando presupuesto a CSV: {output_path}")
             
-            with open(output_path, 'w', newline='', encoding=self.encoding) as csvfile:
+            with self._open_output(output_path, compress) as csvfile:
                 # Crear escritor CSV
                 writer = csv.writer(csvfile, delimiter=self.delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
                 
                 # Información del presupuesto
                 writer.writerow(['PRESUPUESTO DE OBRA'])
                 writer.writerow([])
-                writer.writerow(['Proyecto:', budget_data.get('project', {}).get('name', '')])
-                writer.writerow(['Cliente:', budget_data.get('project', {}).get('client_name', '')])
-                writer.writerow(['Ubicación:', budget_data.get('project', {}).get('location', '')])
+                project = budget_data.get('project', {})
+                writer.writerow(['Proyecto:', project.get('name', '')])
+                writer.writerow(['Cliente:', project.get('client_name', '')])
+                writer.writerow(['Ubicación:', project.get('location', '')])
                 writer.writerow(['Fecha:', datetime.now().strftime('%d/%m/%Y')])
                 writer.writerow([])
                 
@@ -49,8 +94,8 @@ class CSVExporter:
                 profit = budget_data.get('profit_amount', 0)
                 total = budget_data.get('final_amount', 0)
                 
-                writer.writerow(['Costos Directos', f"${subtotal:,.2f}", f"{(subtotal/total*100):.1f}%"])
-                writer.writerow(['Beneficio', f"${profit:,.2f}", f"{(profit/total*100):.1f}%"])
+                writer.writerow(['Costos Directos', f"${subtotal:,.2f}", f"{_percentage(subtotal, total):.1f}%"])
+                writer.writerow(['Beneficio', f"${profit:,.2f}", f"{_percentage(profit, total):.1f}%"])
                 writer.writerow(['TOTAL', f"${total:,.2f}", '100.0%'])
                 writer.writerow([])
                 
@@ -61,15 +106,14 @@ class CSVExporter:
                     writer.writerow([f"CAPÍTULO {chapter}: {data['description']}"])
                     writer.writerow(['Código', 'Descripción', 'Unidad', 'Cantidad', 'P. Unitario', 'Total'])
                     
-                    for item in data['items']:
-                        writer.writerow([
-                            item.get('code', ''),
-                            item.get('description', ''),
-                            item.get('unit', ''),
-                            item.get('quantity', 0),
-                            f"${item.get('unit_price', 0):,.2f}",
-                            f"${item.get('total_price', 0):,.2f}"
-                        ])
+                    writer.writerows([
+                        item.get('code', ''),
+                        item.get('description', ''),
+                        item.get('unit', ''),
+                        item.get('quantity', 0),
+                        f"${item.get('unit_price', 0):,.2f}",
+                        f"${item.get('total_price', 0):,.2f}"
+                    ] for item in data['items'])
                     
                     writer.writerow(['', '', '', '', 'SUBTOTAL', f"${data['total']:,.2f}"])
                     writer.writerow([])
@@ -79,16 +123,17 @@ class CSVExporter:
                 cost_breakdown = budget_data.get('cost_breakdown', {})
                 
                 writer.writerow(['Componente', 'Valor', 'Porcentaje'])
-                writer.writerow(['Mano de Obra', f"${cost_breakdown.get('labor_cost', 0):,.2f}", 
-                               f"{(cost_breakdown.get('labor_cost', 0)/total*100):.1f}%"])
-                writer.writerow(['Materiales', f"${cost_breakdown.get('material_cost', 0):,.2f}", 
-                               f"{(cost_breakdown.get('material_cost', 0)/total*100):.1f}%"])
-                writer.writerow(['Equipo y Maquinaria', f"${cost_breakdown.get('equipment_cost', 0):,.2f}", 
-                               f"{(cost_breakdown.get('equipment_cost', 0)/total*100):.1f}%"])
-                writer.writerow(['Costos Indirectos', f"${cost_breakdown.get('indirect_cost', 0):,.2f}", 
-                               f"{(cost_breakdown.get('indirect_cost', 0)/total*100):.1f}%"])
-                writer.writerow(['Beneficio', f"${cost_breakdown.get('profit_amount', 0):,.2f}", 
-                               f"{(cost_breakdown.get('profit_amount', 0)/total*100):.1f}%"])
+                labor = cost_breakdown.get('labor_cost', 0)
+                material = cost_breakdown.get('material_cost', 0)
+                equipment = cost_breakdown.get('equipment_cost', 0)
+                indirect = cost_breakdown.get('indirect_cost', 0)
+                breakdown_profit = cost_breakdown.get('profit_amount', 0)
+                
+                writer.writerow(['Mano de Obra', f"${labor:,.2f}", f"{_percentage(labor, total):.1f}%"])
+                writer.writerow(['Materiales', f"${material:,.2f}", f"{_percentage(material, total):.1f}%"])
+                writer.writerow(['Equipo y Maquinaria', f"${equipment:,.2f}", f"{_percentage(equipment, total):.1f}%"])
+                writer.writerow(['Costos Indirectos', f"${indirect:,.2f}", f"{_percentage(indirect, total):.1f}%"])
+                writer.writerow(['Beneficio', f"${breakdown_profit:,.2f}", f"{_percentage(breakdown_profit, total):.1f}%"])
                 writer.writerow(['TOTAL', f"${total:,.2f}", '100.0%'])
             
             logger.info(f"Presupuesto exportado a CSV: {output_path}")
@@ -98,13 +143,14 @@ class CSVExporter:
             logger.error(f"Error exportando a CSV: {str(e)}")
             return False
     
-    def export_price_book_to_csv(self, price_book_data: Dict[str, Any], output_path: str) -> bool:
+    def export_price_book_to_csv(self, price_book_data: Dict[str, Any], output_path: str, compress: bool = False) -> bool:
         """
         Exporta un libro de precios a CSV
         
         Args:
             price_book_data: Datos del libro de precios
             output_path: Ruta de salida
+            compress: Si comprimir la salida con gzip (p. ej. para rutas .csv.gz)
             
         Returns:
             True si se exportó exitosamente
@@ -112,51 +158,8 @@ class CSVExporter:
         try:
             logger.info(f"Exportando libro de precios a CSV: {output_path}")
             
-            with open(output_path, 'w', newline='', encoding=self.encoding) as csvfile:
-                writer = csv.writer(csvfile, delimiter=self.delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                
-                # Información del libro de precios
-                writer.writerow(['LIBRO DE PRECIOS'])
-                writer.writerow(['Nombre:', price_book_data.get('name', '')])
-                writer.writerow(['Descripción:', price_book_data.get('description', '')])
-                writer.writerow(['Fecha:', datetime.now().strftime('%d/%m/%Y')])
-                writer.writerow([])
-                
-                # Encabezados
-                writer.writerow(['Código', 'Descripción', 'Unidad', 'Precio Unitario', 'Categoría', 
-                               '% Mano de Obra', '% Materiales', '% Equipo', 'Rendimiento', 'Notas'])
-                
-                # Datos de precios
-                entries = price_book_data.get('entries', [])
-                for entry in entries:
-                    writer.writerow([
-                        entry.get('code', ''),
-                        entry.get('description', ''),
-                        entry.get('unit', ''),
-                        f"${entry.get('unit_price', 0):,.2f}",
-                        entry.get('category', ''),
-                        f"{entry.get('labor_percentage', 40):.1f}%",
-                        f"{entry.get('material_percentage', 50):.1f}%",
-                        f"{entry.get('equipment_percentage', 10):.1f}%",
-                        f"{entry.get('performance_rate', 1.0):.2f}",
-                        entry.get('notes', '')
-                    ])
-                
-                # Estadísticas
-                if entries:
-                    writer.writerow([])
-                    writer.writerow(['ESTADÍSTICAS'])
-                    
-                    prices = [entry.get('unit_price', 0) for entry in entries]
-                    categories = list(set(entry.get('category', 'General') for entry in entries))
-                    units = list(set(entry.get('unit', 'un') for entry in entries))
-                    
-                    writer.writerow(['Total de Partidas', len(entries)])
-                    writer.writerow(['Precio Promedio', f"${sum(prices) / len(prices):,.2f}"])
-                    writer.writerow(['Precio Mínimo', f"${min(prices):,.2f}"])
-                    writer.writerow(['Precio Máximo', f"${max(prices):,.2f}"])
-                    writer.writerow(['Número de Categorías', len(categories)])
-                    writer.writerow(['Número de Unidades', len(units)])
+            with self._open_output(output_path, compress, binary=True) as csvfile:
+                csvfile.writelines(self.iter_price_book_csv(price_book_data))
             
             logger.info(f"Libro de precios exportado a CSV: {output_path}")
             return True
@@ -165,13 +168,114 @@ class CSVExporter:
             logger.error(f"Error exportando libro de precios a CSV: {str(e)}")
             return False
     
-    def export_comparison_to_csv(self, budgets_data: List[Dict[str, Any]], output_path: str) -> bool:
+    def iter_price_book_csv(self, price_book_data: Dict[str, Any],
+                            entries: Optional[Iterable[Dict[str, Any]]] = None) -> Iterator[bytes]:
+        """
+        Genera el CSV de un libro de precios por fragmentos, sin materializar el
+        archivo completo (apto para un StreamingResponse)
+        
+        Args:
+            price_book_data: Datos del libro de precios
+            entries: Partidas a exportar (cualquier iterable); por defecto price_book_data['entries']
+            
+        Yields:
+            Fragmentos del CSV codificados con la codificación del exportador
+        """
+        if entries is None:
+            entries = price_book_data.get('entries', [])
+        
+        # Buffer de trabajo reutilizable: se vacía cada vez que se emite un fragmento
+        buffer = io.StringIO(newline='')
+        writer = csv.writer(buffer, delimiter=self.delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        encoder = codecs.getincrementalencoder(self.encoding)()
+        
+        def take_chunk() -> bytes:
+            chunk = encoder.encode(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate(0)
+            return chunk
+        
+        # Información del libro de precios
+        writer.writerow(['LIBRO DE PRECIOS'])
+        writer.writerow(['Nombre:', price_book_data.get('name', '')])
+        writer.writerow(['Descripción:', price_book_data.get('description', '')])
+        writer.writerow(['Fecha:', datetime.now().strftime('%d/%m/%Y')])
+        writer.writerow([])
+        
+        # Encabezados
+        writer.writerow(['Código', 'Descripción', 'Unidad', 'Precio Unitario', 'Categoría', 
+                       '% Mano de Obra', '% Materiales', '% Equipo', 'Rendimiento', 'Notas'])
+        yield take_chunk()
+        
+        # Datos de precios; las estadísticas se acumulan en la misma pasada
+        count = 0
+        price_sum = 0
+        min_price = max_price = None
+        categories = set()
+        units = set()
+        # Las filas se agrupan en lotes y se escriben con una sola llamada writerows
+        batch = []
+        add_row = batch.append
+        add_category = categories.add
+        add_unit = units.add
+        flush_interval = self.flush_interval
+        
+        for entry in entries:
+            get = entry.get
+            price = get('unit_price', 0)
+            add_row([
+                get('code', ''),
+                get('description', ''),
+                get('unit', ''),
+                f"${price:,.2f}",
+                get('category', ''),
+                f"{get('labor_percentage', 40):.1f}%",
+                f"{get('material_percentage', 50):.1f}%",
+                f"{get('equipment_percentage', 10):.1f}%",
+                f"{get('performance_rate', 1.0):.2f}",
+                get('notes', '')
+            ])
+            count += 1
+            price_sum += price
+            if min_price is None or price < min_price:
+                min_price = price
+            if max_price is None or price > max_price:
+                max_price = price
+            add_category(get('category', 'General'))
+            add_unit(get('unit', 'un'))
+            
+            if len(batch) >= flush_interval:
+                writer.writerows(batch)
+                batch.clear()
+                yield take_chunk()
+        
+        writer.writerows(batch)
+        
+        # Estadísticas
+        if count:
+            writer.writerow([])
+            writer.writerow(['ESTADÍSTICAS'])
+            
+            writer.writerow(['Total de Partidas', count])
+            writer.writerow(['Precio Promedio', f"${price_sum / count:,.2f}"])
+            writer.writerow(['Precio Mínimo', f"${min_price:,.2f}"])
+            writer.writerow(['Precio Máximo', f"${max_price:,.2f}"])
+            writer.writerow(['Número de Categorías', len(categories)])
+            writer.writerow(['Número de Unidades', len(units)])
+        
+        # Cerrar el codificador (algunas codificaciones emiten bytes finales)
+        chunk = take_chunk() + encoder.encode('', final=True)
+        if chunk:
+            yield chunk
+    
+    def export_comparison_to_csv(self, budgets_data: List[Dict[str, Any]], output_path: str, compress: bool = False) -> bool:
         """
         Exporta comparación de presupuestos a CSV
         
         Args:
             budgets_data: Lista de presupuestos
             output_path: Ruta de salida
+            compress: Si comprimir la salida con gzip (p. ej. para rutas .csv.gz)
             
         Returns:
             True si se exportó exitosamente
@@ -179,7 +283,7 @@ class CSVExporter:
         try:
             logger.info(f"Exportando comparación a CSV: {output_path}")
             
-            with open(output_path, 'w', newline='', encoding=self.encoding) as csvfile:
+            with self._open_output(output_path, compress) as csvfile:
                 writer = csv.writer(csvfile, delimiter=self.delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
                 
                 writer.writerow(['COMPARACIÓN DE PRESUPUESTOS'])
@@ -190,44 +294,9 @@ class CSVExporter:
                 headers = ['CONCEPTO'] + [budget.get('name', f"Presupuesto {i+1}") for i, budget in enumerate(budgets_data)]
                 writer.writerow(headers)
                 
-                # Datos de comparación
-                comparison_data = [
-                    ['Subtotal', 'total_amount - profit_amount'],
-                    ['Beneficio', 'profit_amount'],
-                    ['Total', 'final_amount'],
-                    ['Margen de Beneficio (%)', 'profit_margin'],
-                    ['Número de Partidas', 'item_count'],
-                    ['Fecha de Creación', 'created_at']
-                ]
-                
-                for concept, field in comparison_data:
-                    row_data = [concept]
-                    
-                    for budget in budgets_data:
-                        if field == 'total_amount - profit_amount':
-                            value = budget.get('total_amount', 0) - budget.get('profit_amount', 0)
-                        elif field == 'profit_amount':
-                            value = budget.get('profit_amount', 0)
-                        elif field == 'final_amount':
-                            value = budget.get('final_amount', 0)
-                        elif field == 'profit_margin':
-                            total = budget.get('total_amount', 1)
-                            profit = budget.get('profit_amount', 0)
-                            value = (profit / total * 100) if total > 0 else 0
-                            value = f"{value:.1f}%"
-                        elif field == 'item_count':
-                            value = len(budget.get('items', []))
-                        elif field == 'created_at':
-                            value = budget.get('created_at', 'N/A')
-                        else:
-                            value = budget.get(field, '')
-                        
-                        if isinstance(value, (int, float)) and field not in ['profit_margin', 'item_count', 'created_at']:
-                            value = f"${value:,.2f}"
-                        
-                        row_data.append(value)
-                    
-                    writer.writerow(row_data)
+                # Datos de comparación: una fila por concepto
+                for concept, extract in _COMPARISON_ROWS:
+                    writer.writerow([concept, *[extract(budget) for budget in budgets_data]])
                 
                 # Análisis de variaciones si hay al menos 2 presupuestos
                 if len(budgets_data) >= 2:
@@ -257,13 +326,14 @@ class CSVExporter:
             logger.error(f"Error exportando comparación a CSV: {str(e)}")
             return False
     
-    def export_materials_list_to_csv(self, materials_data: Dict[str, Any], output_path: str) -> bool:
+    def export_materials_list_to_csv(self, materials_data: Dict[str, Any], output_path: str, compress: bool = False) -> bool:
         """
         Exporta lista de materiales a CSV
         
         Args:
             materials_data: Datos de materiales
             output_path: Ruta de salida
+            compress: Si comprimir la salida con gzip (p. ej. para rutas .csv.gz)
             
         Returns:
             True si se exportó exitosamente
@@ -271,7 +341,7 @@ class CSVExporter:
         try:
             logger.info(f"Exportando lista de materiales a CSV: {output_path}")
             
-            with open(output_path, 'w', newline='', encoding=self.encoding) as csvfile:
+            with self._open_output(output_path, compress) as csvfile:
                 writer = csv.writer(csvfile, delimiter=self.delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
                 
                 writer.writerow(['LISTA DE MATERIALES'])
@@ -282,14 +352,13 @@ class CSVExporter:
                 
                 materials = materials_data.get('materials', {})
                 
-                for material_key, material_data in materials.items():
-                    writer.writerow([
-                        material_key,
-                        material_data.get('unit', ''),
-                        material_data.get('quantity', 0),
-                        f"${material_data.get('estimated_cost', 0):,.2f}",
-                        len(material_data.get('items', []))
-                    ])
+                writer.writerows([
+                    material_key,
+                    material_data.get('unit', ''),
+                    material_data.get('quantity', 0),
+                    f"${material_data.get('estimated_cost', 0):,.2f}",
+                    len(material_data.get('items', []))
+                ] for material_key, material_data in materials.items())
                 
                 # Total
                 writer.writerow([])
@@ -302,13 +371,14 @@ class CSVExporter:
             logger.error(f"Error exportando lista de materiales: {str(e)}")
             return False
     
-    def export_labor_analysis_to_csv(self, labor_data: Dict[str, Any], output_path: str) -> bool:
+    def export_labor_analysis_to_csv(self, labor_data: Dict[str, Any], output_path: str, compress: bool = False) -> bool:
         """
         Exporta análisis de mano de obra a CSV
         
         Args:
             labor_data: Datos de mano de obra
             output_path: Ruta de salida
+            compress: Si comprimir la salida con gzip (p. ej. para rutas .csv.gz)
             
         Returns:
             True si se exportó exitosamente
@@ -316,7 +386,7 @@ class CSVExporter:
         try:
             logger.info(f"Exportando análisis de mano de obra a CSV: {output_path}")
             
-            with open(output_path, 'w', newline='', encoding=self.encoding) as csvfile:
+            with self._open_output(output_path, compress) as csvfile:
                 writer = csv.writer(csvfile, delimiter=self.delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
                 
                 writer.writerow(['ANÁLISIS DE MANO DE OBRA'])
@@ -333,12 +403,11 @@ class CSVExporter:
                 writer.writerow(['Categoría', 'Costo de Mano de Obra', 'Horas Estimadas'])
                 
                 categories = labor_data.get('categories', {})
-                for category, data in categories.items():
-                    writer.writerow([
-                        category,
-                        f"${data.get('labor_cost', 0):,.2f}",
-                        f"{data.get('estimated_hours', 0):,.1f}"
-                    ])
+                writer.writerows([
+                    category,
+                    f"${data.get('labor_cost', 0):,.2f}",
+                    f"{data.get('estimated_hours', 0):,.1f}"
+                ] for category, data in categories.items())
             
             logger.info(f"Análisis de mano de obra exportado a CSV: {output_path}")
             return True
@@ -347,6 +416,19 @@ class CSVExporter:
             logger.error(f"Error exportando análisis de mano de obra: {str(e)}")
             return False
     
+    def _open_output(self, output_path: str, compress: bool = False, binary: bool = False):
+        """Abre el archivo de salida, comprimido con gzip si se solicita"""
+        
+        if compress:
+            if binary:
+                return gzip.open(output_path, 'wb', compresslevel=self.COMPRESS_LEVEL)
+            return gzip.open(output_path, 'wt', newline='', encoding=self.encoding,
+                             compresslevel=self.COMPRESS_LEVEL)
+        
+        if binary:
+            return open(output_path, 'wb', buffering=self.BUFFER_SIZE)
+        return open(output_path, 'w', newline='', encoding=self.encoding, buffering=self.BUFFER_SIZE)
+    
     def _group_items_by_chapter(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Agrupa items por capítulo"""
         
@@ -355,15 +437,17 @@ class CSVExporter:
         for item in items:
             chapter = item.get('chapter', 'Sin Capítulo')
             
-            if chapter not in chapters:
-                chapters[chapter] = {
+            # Una sola búsqueda en el diccionario por item
+            data = chapters.get(chapter)
+            if data is None:
+                data = chapters[chapter] = {
                     'description': f"Capítulo {chapter}",
                     'items': [],
                     'total': 0.0
                 }
             
-            chapters[chapter]['items'].append(item)
-            chapters[chapter]['total'] += float(item.get('total_price', 0))
+            data['items'].append(item)
+            data['total'] += float(item.get('total_price', 0))
         
         return chapters
     
@@ -385,8 +469,7 @@ class CSVExporter:
             if headers:
                 writer.writerow(headers)
             
-            for row in data:
-                writer.writerow(row)
+            writer.writerows(data)
             
             return output.getvalue()
             
@@ -1,16 +1,68 @@
-import pandas as pd
+import numpy as np
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Border, Side, Alignment, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
 from openpyxl.chart import BarChart, PieChart, Reference
 from openpyxl.chart.series import DataPoint
-from decimal import Decimal
+from openpyxl.utils import get_column_letter
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Estilos compartidos: se construyen una sola vez y openpyxl los deduplica por referencia
+_TITLE_FONT = Font(size=14, bold=True)
+_SECTION_FONT = Font(size=12, bold=True)
+_SMALL_FONT = Font(size=10)
+_BANNER_FONT = Font(size=16, bold=True, color="FFFFFF")
+_BANNER_FILL = PatternFill(start_color="2E4057", end_color="2E4057", fill_type="solid")
+_HEADER_FONT = Font(bold=True, color="FFFFFF")
+_HEADER_FILL = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
+_BOLD_FONT = Font(bold=True)
+_SECTION_FILL = PatternFill(start_color="E8F4FD", end_color="E8F4FD", fill_type="solid")
+_TOTAL_FILL = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
+_CENTER_ALIGN = Alignment(horizontal='center')
+_RIGHT_ALIGN = Alignment(horizontal='right')
+_WRAP_ALIGN = Alignment(wrap_text=True)
+_THIN_SIDE = Side(style='thin')
+_THIN_BORDER = Border(left=_THIN_SIDE, right=_THIN_SIDE, top=_THIN_SIDE, bottom=_THIN_SIDE)
+_CURRENCY_FORMAT = '$#,##0.00'
+
+# Estilos con nombre (se registran en cada workbook): importes alineados a la derecha y
+# celdas de tabla con borde fino, que se asignan con una sola operación por celda
+_CURRENCY_STYLE = 'moneda'
+_TABLE_STYLE = 'tabla'
+_TABLE_CURRENCY_STYLE = 'tabla_moneda'
+
+
+def _styled_cell(ws, value=None, font=None, fill=None, alignment=None, border=None,
+                 number_format=None, style=None) -> WriteOnlyCell:
+    """Crea una celda de solo escritura con los estilos indicados"""
+    cell = WriteOnlyCell(ws, value=value)
+    if style is not None:
+        cell.style = style
+    if font is not None:
+        cell.font = font
+    if fill is not None:
+        cell.fill = fill
+    if alignment is not None:
+        cell.alignment = alignment
+    if border is not None:
+        cell.border = border
+    if number_format is not None:
+        cell.number_format = number_format
+    return cell
+
+
+def _set_column_widths(ws, widths: Dict[str, float]):
+    """Asigna los anchos de columna indicados por letra (antes de escribir filas en modo de solo escritura)"""
+    dimensions = ws.column_dimensions
+    for column, width in widths.items():
+        dimensions[column].width = width
+
+
 class ExcelExporter:
     """Exporta presupuestos y datos a formato Excel"""
     
@@ -34,19 +86,19 @@ class ExcelExporter:
         try:
             logger.info(f"Exportando presupuesto a Excel: {output_path}")
             
-            # Crear workbook
-            self.workbook = Workbook()
+            # Crear workbook en modo de solo escritura: cada hoja se vuelca fila a fila
+            self.workbook = self.make_workbook()
             
-            # Remover hoja por defecto
-            self.workbook.remove(self.workbook.active)
+            # Agrupar items por capítulo una sola vez (lo usan el detalle y los gráficos)
+            chapters = self._group_items_by_chapter(budget_data.get('items', []))
             
             # Crear hojas
             self._create_summary_sheet(budget_data)
-            self._create_detailed_items_sheet(budget_data)
+            self._create_detailed_items_sheet(chapters)
             self._create_cost_analysis_sheet(budget_data)
             
             if include_charts:
-                self._create_charts_sheet(budget_data)
+                self._create_charts_sheet(budget_data, chapters)
             
             # Guardar archivo
             self.workbook.save(output_path)
@@ -73,8 +125,8 @@ class ExcelExporter:
         try:
             logger.info(f"Exportando comparación de presupuestos: {output_path}")
             
-            self.workbook = Workbook()
-            self.workbook.remove(self.workbook.active)
+            # Modo de solo escritura: las filas se vuelcan en orden sin mantener la grilla en memoria
+            self.workbook = self.make_workbook()
             
             # Hoja de comparación
             self._create_comparison_sheet(budgets_data)
@@ -105,8 +157,8 @@ class ExcelExporter:
         try:
             logger.info(f"Exportando libro de precios: {output_path}")
             
-            self.workbook = Workbook()
-            self.workbook.remove(self.workbook.active)
+            # Modo de solo escritura: las filas se vuelcan en orden sin mantener la grilla en memoria
+            self.workbook = self.make_workbook()
             
             # Hoja principal de precios
             self._create_price_book_sheet(price_book_data)
@@ -127,195 +179,188 @@ class ExcelExporter:
             logger.error(f"Error exportando libro de precios: {str(e)}")
             return False
     
+    @classmethod
+    def make_workbook(cls) -> Workbook:
+        """Crea un workbook de solo escritura con los estilos con nombre ya registrados"""
+        workbook = Workbook(write_only=True)
+        cls._register_named_styles(workbook)
+        return workbook
+    
+    @staticmethod
+    def _register_named_styles(workbook: Workbook):
+        """Registra en el workbook los estilos con nombre usados en las filas de datos"""
+        
+        workbook.add_named_style(NamedStyle(
+            name=_CURRENCY_STYLE,
+            font=DEFAULT_FONT,
+            number_format=_CURRENCY_FORMAT,
+            alignment=_RIGHT_ALIGN
+        ))
+        workbook.add_named_style(NamedStyle(
+            name=_TABLE_STYLE,
+            font=DEFAULT_FONT,
+            border=_THIN_BORDER
+        ))
+        workbook.add_named_style(NamedStyle(
+            name=_TABLE_CURRENCY_STYLE,
+            font=DEFAULT_FONT,
+            border=_THIN_BORDER,
+            number_format=_CURRENCY_FORMAT,
+            alignment=_RIGHT_ALIGN
+        ))
+    
     def _create_summary_sheet(self, budget_data: Dict[str, Any]):
         """Crea hoja de resumen del presupuesto"""
         
         ws = self.workbook.create_sheet("Resumen")
         
+        # Ajustar anchos de columna (en modo de solo escritura, antes de escribir filas)
+        _set_column_widths(ws, {'A': 25, 'B': 15, 'C': 12})
+        
         # Títulos principales
-        ws['A1'] = "PRESUPUESTO DE OBRA"
-        ws['A1'].font = Font(size=16, bold=True, color="FFFFFF")
-        ws['A1'].fill = PatternFill(start_color="2E4057", end_color="2E4057", fill_type="solid")
-        ws.merge_cells('A1:F1')
-        
-        # Información del proyecto
-        ws['A3'] = "Proyecto:"
-        ws['B3'] = budget_data.get('project', {}).get('name', '')
-        ws['A4'] = "Cliente:"
-        ws['B4'] = budget_data.get('project', {}).get('client_name', '')
-        ws['A5'] = "Ubicación:"
-        ws['B5'] = budget_data.get('project', {}).get('location', '')
-        ws['A6'] = "Fecha:"
-        ws['B6'] = datetime.now().strftime('%d/%m/%Y')
-        
-        # Formato para etiquetas
-        for row in range(3, 7):
-            ws[f'A{row}'].font = Font(bold=True)
-            ws[f'A{row}'].alignment = Alignment(horizontal='right')
+        ws.append([_styled_cell(ws, "PRESUPUESTO DE OBRA", font=_BANNER_FONT, fill=_BANNER_FILL)])
+        ws.merged_cells.add('A1:F1')
+        ws.append([])
+        
+        # Información del proyecto (filas 3 a 6, con etiquetas en negrita alineadas a la derecha)
+        project = budget_data.get('project', {})
+        project_info = [
+            ["Proyecto:", project.get('name', '')],
+            ["Cliente:", project.get('client_name', '')],
+            ["Ubicación:", project.get('location', '')],
+            ["Fecha:", datetime.now().strftime('%d/%m/%Y')]
+        ]
+        
+        for label, value in project_info:
+            ws.append([_styled_cell(ws, label, font=_BOLD_FONT, alignment=_RIGHT_ALIGN), value])
+        ws.append([])
         
         # Resumen de costos
-        ws['A8'] = "RESUMEN DE COSTOS"
-        ws['A8'].font = Font(size=12, bold=True)
-        ws['A8'].fill = PatternFill(start_color="E8F4FD", end_color="E8F4FD", fill_type="solid")
-        ws.merge_cells('A8:C8')
+        ws.append([_styled_cell(ws, "RESUMEN DE COSTOS", font=_SECTION_FONT, fill=_SECTION_FILL)])
+        ws.merged_cells.add('A8:C8')
+        
+        # Datos de costos (los porcentajes se calculan sobre total_amount, o 1 si falta)
+        total_amount = budget_data.get('total_amount', 0)
+        profit_amount = budget_data.get('profit_amount', 0)
+        percentage_base = budget_data.get('total_amount', 1)
+        direct_costs = total_amount - profit_amount
         
-        # Datos de costos
         cost_data = [
             ['Concepto', 'Valor', 'Porcentaje'],
-            ['Costos Directos', budget_data.get('total_amount', 0) - budget_data.get('profit_amount', 0),
-             ((budget_data.get('total_amount', 0) - budget_data.get('profit_amount', 0)) / budget_data.get('total_amount', 1) * 100)],
-            ['Beneficio', budget_data.get('profit_amount', 0),
-             (budget_data.get('profit_amount', 0) / budget_data.get('total_amount', 1) * 100)],
+            ['Costos Directos', direct_costs, (direct_costs / percentage_base * 100)],
+            ['Beneficio', profit_amount, (profit_amount / percentage_base * 100)],
             ['TOTAL PRESUPUESTO', budget_data.get('final_amount', 0), 100.0]
         ]
         
-        # Escribir datos de costos
+        # Escribir datos de costos (con bordes en toda la tabla)
         for i, (concept, value, percentage) in enumerate(cost_data):
-            row = 9 + i
-            ws[f'A{row}'] = concept
-            ws[f'B{row}'] = value
-            ws[f'C{row}'] = f"{percentage:.1f}%"
-            
-            # Formato de moneda para valores
-            if i > 0:  # Excluir encabezados
-                ws[f'B{row}'].number_format = '$#,##0.00'
-            
             # Formato para totales
-            if concept == 'TOTAL PRESUPUESTO':
-                ws[f'A{row}'].font = Font(bold=True)
-                ws[f'B{row}'].font = Font(bold=True)
-                ws[f'C{row}'].font = Font(bold=True)
-                ws[f'A{row}'].fill = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
-                ws[f'B{row}'].fill = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
-                ws[f'C{row}'].fill = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 25
-        ws.column_dimensions['B'].width = 15
-        ws.column_dimensions['C'].width = 12
-        
-        # Agregar bordes
-        self._add_borders_to_range(ws, f'A9:C{9 + len(cost_data) - 1}')
+            is_total = concept == 'TOTAL PRESUPUESTO'
+            font = _BOLD_FONT if is_total else None
+            fill = _TOTAL_FILL if is_total else None
+            
+            ws.append([
+                _styled_cell(ws, concept, font=font, fill=fill, border=_THIN_BORDER),
+                # Formato de moneda para valores (excluir encabezados)
+                _styled_cell(ws, value, font=font, fill=fill, border=_THIN_BORDER,
+                             number_format=_CURRENCY_FORMAT if i > 0 else None),
+                # La fila de encabezados lleva el título de la columna, no un porcentaje
+                _styled_cell(ws, f"{percentage:.1f}%" if i > 0 else percentage,
+                             font=font, fill=fill, border=_THIN_BORDER)
+            ])
     
-    def _create_detailed_items_sheet(self, budget_data: Dict[str, Any]):
+    def _create_detailed_items_sheet(self, chapters: Dict[str, Any]):
         """Crea hoja de detalle de partidas"""
         
         ws = self.workbook.create_sheet("Partidas Detalladas")
         
+        # Ajustar anchos de columna (en modo de solo escritura, antes de escribir filas)
+        _set_column_widths(ws, {'A': 15, 'B': 12, 'C': 40, 'D': 10, 'E': 12, 'F': 15, 'G': 15})
+        
         # Encabezados
         headers = ['Capítulo', 'Código', 'Descripción', 'Unidad', 'Cantidad', 'P. Unitario', 'Total']
-        for i, header in enumerate(headers):
-            cell = ws.cell(row=1, column=i+1, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center')
+        ws.append([
+            _styled_cell(ws, header, font=_HEADER_FONT, fill=_HEADER_FILL, alignment=_CENTER_ALIGN)
+            for header in headers
+        ])
         
-        # Agrupar items por capítulo
-        chapters = self._group_items_by_chapter(budget_data.get('items', []))
-        
-        row = 2
         for chapter, data in chapters.items():
-            # Escribir items del capítulo
+            # Escribir items del capítulo: solo cantidad e importes llevan estilo
             for item in data['items']:
-                ws.cell(row=row, column=1, value=chapter)
-                ws.cell(row=row, column=2, value=item.get('code', ''))
-                ws.cell(row=row, column=3, value=item.get('description', ''))
-                ws.cell(row=row, column=4, value=item.get('unit', ''))
-                ws.cell(row=row, column=5, value=item.get('quantity', 0))
-                ws.cell(row=row, column=6, value=item.get('unit_price', 0))
-                ws.cell(row=row, column=7, value=item.get('total_price', 0))
-                
-                # Formato de moneda
-                ws[f'F{row}'].number_format = '$#,##0.00'
-                ws[f'G{row}'].number_format = '$#,##0.00'
-                
-                # Alinear números a la derecha
-                ws[f'E{row}'].alignment = Alignment(horizontal='right')
-                ws[f'F{row}'].alignment = Alignment(horizontal='right')
-                ws[f'G{row}'].alignment = Alignment(horizontal='right')
-                
-                row += 1
+                get = item.get
+                ws.append((
+                    chapter,
+                    get('code', ''),
+                    get('description', ''),
+                    get('unit', ''),
+                    _styled_cell(ws, get('quantity', 0), alignment=_RIGHT_ALIGN),
+                    _styled_cell(ws, get('unit_price', 0), style=_CURRENCY_STYLE),
+                    _styled_cell(ws, get('total_price', 0), style=_CURRENCY_STYLE)
+                ))
             
             # Subtotal del capítulo
-            ws.cell(row=row, column=6, value="SUBTOTAL")
-            ws[f'F{row}'].font = Font(bold=True)
-            ws.cell(row=row, column=7, value=data['total'])
-            ws[f'G{row}'].font = Font(bold=True)
-            ws[f'G{row}'].number_format = '$#,##0.00'
-            ws[f'G{row}'].fill = PatternFill(start_color="E8F4FD", end_color="E8F4FD", fill_type="solid")
-            
-            row += 2  # Espacio entre capítulos
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 15
-        ws.column_dimensions['B'].width = 12
-        ws.column_dimensions['C'].width = 40
-        ws.column_dimensions['D'].width = 10
-        ws.column_dimensions['E'].width = 12
-        ws.column_dimensions['F'].width = 15
-        ws.column_dimensions['G'].width = 15
+            ws.append((
+                None, None, None, None, None,
+                _styled_cell(ws, "SUBTOTAL", font=_BOLD_FONT),
+                _styled_cell(ws, data['total'], font=_BOLD_FONT, number_format=_CURRENCY_FORMAT, fill=_SECTION_FILL)
+            ))
+            
+            # Espacio entre capítulos
+            ws.append(())
     
     def _create_cost_analysis_sheet(self, budget_data: Dict[str, Any]):
         """Crea hoja de análisis de costos"""
         
         ws = self.workbook.create_sheet("Análisis de Costos")
         
+        # Ajustar anchos de columna (en modo de solo escritura, antes de escribir filas)
+        _set_column_widths(ws, {'A': 20, 'B': 15, 'C': 15})
+        
         # Título
-        ws['A1'] = "ANÁLISIS DE COSTOS"
-        ws['A1'].font = Font(size=14, bold=True)
-        ws.merge_cells('A1:D1')
+        ws.append([_styled_cell(ws, "ANÁLISIS DE COSTOS", font=_TITLE_FONT)])
+        ws.merged_cells.add('A1:D1')
+        ws.append([])
         
         # Desglose de costos
         cost_breakdown = budget_data.get('cost_breakdown', {})
         
-        # Tabla de desglose
+        # Tabla de desglose (porcentajes sobre total_amount, o 1 si falta)
+        percentage_base = budget_data.get('total_amount', 1)
+        components = [
+            ('Mano de Obra', cost_breakdown.get('labor_cost', 0)),
+            ('Materiales', cost_breakdown.get('material_cost', 0)),
+            ('Equipo y Maquinaria', cost_breakdown.get('equipment_cost', 0)),
+            ('Costos Indirectos', cost_breakdown.get('indirect_cost', 0)),
+            ('Beneficio', cost_breakdown.get('profit_amount', 0))
+        ]
+        
         breakdown_data = [
             ['COMPONENTE', 'VALOR', 'PORCENTAJE SOBRE TOTAL', ''],
-            ['Mano de Obra', cost_breakdown.get('labor_cost', 0),
-             (cost_breakdown.get('labor_cost', 0) / budget_data.get('total_amount', 1) * 100), ''],
-            ['Materiales', cost_breakdown.get('material_cost', 0),
-             (cost_breakdown.get('material_cost', 0) / budget_data.get('total_amount', 1) * 100), ''],
-            ['Equipo y Maquinaria', cost_breakdown.get('equipment_cost', 0),
-             (cost_breakdown.get('equipment_cost', 0) / budget_data.get('total_amount', 1) * 100), ''],
-            ['Costos Indirectos', cost_breakdown.get('indirect_cost', 0),
-             (cost_breakdown.get('indirect_cost', 0) / budget_data.get('total_amount', 1) * 100), ''],
-            ['Beneficio', cost_breakdown.get('profit_amount', 0),
-             (cost_breakdown.get('profit_amount', 0) / budget_data.get('total_amount', 1) * 100), ''],
+            *[[component, value, (value / percentage_base * 100), ''] for component, value in components],
             ['TOTAL', budget_data.get('total_amount', 0), 100.0, '']
         ]
         
-        # Escribir datos
+        # Escribir datos (con bordes en toda la tabla)
         for i, (component, value, percentage, _) in enumerate(breakdown_data):
-            row = 3 + i
-            ws[f'A{row}'] = component
-            ws[f'B{row}'] = value
-            ws[f'C{row}'] = f"{percentage:.1f}%"
-            
-            # Formato de moneda
-            if i > 0 and component != 'TOTAL':
-                ws[f'B{row}'].number_format = '$#,##0.00'
-            
             # Formato para totales
-            if component == 'TOTAL':
-                ws[f'A{row}'].font = Font(bold=True)
-                ws[f'B{row}'].font = Font(bold=True)
-                ws[f'C{row}'].font = Font(bold=True)
-                ws[f'A{row}'].fill = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
-                ws[f'B{row}'].fill = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
-                ws[f'C{row}'].fill = PatternFill(start_color="D5E8F7", end_color="D5E8F7", fill_type="solid")
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 20
-        ws.column_dimensions['B'].width = 15
-        ws.column_dimensions['C'].width = 15
-        
-        # Agregar bordes
-        self._add_borders_to_range(ws, f'A3:C{3 + len(breakdown_data) - 1}')
-        
-        # Notas adicionales
-        notes_row = 3 + len(breakdown_data) + 2
-        ws[f'A{notes_row}'] = "NOTAS:"
-        ws[f'A{notes_row}'].font = Font(bold=True)
+            is_total = component == 'TOTAL'
+            font = _BOLD_FONT if is_total else None
+            fill = _TOTAL_FILL if is_total else None
+            
+            ws.append([
+                _styled_cell(ws, component, font=font, fill=fill, border=_THIN_BORDER),
+                # Formato de moneda
+                _styled_cell(ws, value, font=font, fill=fill, border=_THIN_BORDER,
+                             number_format=_CURRENCY_FORMAT if i > 0 and not is_total else None),
+                # La fila de encabezados lleva el título de la columna, no un porcentaje
+                _styled_cell(ws, f"{percentage:.1f}%" if i > 0 else percentage,
+                             font=font, fill=fill, border=_THIN_BORDER)
+            ])
+        
+        # Notas adicionales (tras dos filas en blanco)
+        ws.append([])
+        ws.append([])
+        ws.append([_styled_cell(ws, "NOTAS:", font=_BOLD_FONT)])
         
         notes = [
             "• Los precios incluyen todos los costos directos e indirectos necesarios para la ejecución de la obra.",
@@ -324,11 +369,10 @@ class ExcelExporter:
             "• Cualquier modificación en el alcance de los trabajos deberá ser notificada por escrito."
         ]
         
-        for i, note in enumerate(notes):
-            ws[f'A{notes_row + 1 + i}'] = note
-            ws[f'A{notes_row + 1 + i}'].alignment = Alignment(wrap_text=True)
+        for note in notes:
+            ws.append([_styled_cell(ws, note, alignment=_WRAP_ALIGN)])
     
-    def _create_charts_sheet(self, budget_data: Dict[str, Any]):
+    def _create_charts_sheet(self, budget_data: Dict[str, Any], chapters: Dict[str, Any]):
         """Crea hoja con gráficos"""
         
         ws = self.workbook.create_sheet("Gráficos")
@@ -346,10 +390,10 @@ class ExcelExporter:
             ['Beneficio', cost_breakdown.get('profit_amount', 0)]
         ]
         
-        # Escribir datos del gráfico
-        for i, (component, value) in enumerate(chart_data):
-            ws[f'A{2 + i}'] = component
-            ws[f'B{2 + i}'] = value
+        # Escribir datos del gráfico: fila 1 en blanco y la tabla en A2:B7
+        ws.append(())
+        for row in chart_data:
+            ws.append(row)
         
         # Crear gráfico de pastel
         pie = PieChart()
@@ -360,35 +404,31 @@ class ExcelExporter:
         pie.add_data(data, titles_from_data=True)
         pie.set_categories(labels)
         
-        # Colores personalizados
+        # Colores personalizados, un punto de datos por componente
         colors = ["4472C4", "70AD47", "FFC000", "FF6D01", "C55A5A", "7030A0"]
-        for i, color in enumerate(colors):
-            if i < len(pie.series[0].points):
-                pie.series[0].points[i].graphicalProperties.solidFill = color
+        for i, color in enumerate(colors[:len(chart_data) - 1]):
+            point = DataPoint(idx=i)
+            point.graphicalProperties.solidFill = color
+            pie.series[0].dPt.append(point)
         
         ws.add_chart(pie, "D2")
         
-        # Gráfico de barras por capítulo
-        chapters = self._group_items_by_chapter(budget_data.get('items', []))
-        
-        # Datos para gráfico de barras
-        bar_data = [['Capítulo', 'Valor']]
-        for chapter, data in chapters.items():
-            bar_data.append([chapter, data['total']])
-        
-        # Escribir datos
+        # Datos para gráfico de barras por capítulo: dos filas de separación y la tabla desde la fila 10
         start_row = 10
-        for i, (chapter, value) in enumerate(bar_data):
-            ws[f'A{start_row + i}'] = chapter
-            ws[f'B{start_row + i}'] = value
+        ws.append(())
+        ws.append(())
+        ws.append(['Capítulo', 'Valor'])
+        for chapter, chapter_data in chapters.items():
+            ws.append([chapter, chapter_data['total']])
+        end_row = start_row + len(chapters)
         
         # Crear gráfico de barras
         bar = BarChart()
         bar.title = "Costos por Capítulo"
         bar.y_axis.title = 'Valor ($)'
         
-        labels = Reference(ws, min_col=1, min_row=start_row + 1, max_row=start_row + len(bar_data) - 1)
-        data = Reference(ws, min_col=2, min_row=start_row, max_row=start_row + len(bar_data) - 1)
+        labels = Reference(ws, min_col=1, min_row=start_row + 1, max_row=end_row)
+        data = Reference(ws, min_col=2, min_row=start_row, max_row=end_row)
         bar.add_data(data, titles_from_data=True)
         bar.set_categories(labels)
         
@@ -399,22 +439,19 @@ class ExcelExporter:
         
         ws = self.workbook.create_sheet("Comparación")
         
+        # Ajustar anchos de columna (en modo de solo escritura, antes de escribir filas)
+        widths = {'A': 25}
+        widths.update((get_column_letter(i + 2), 15) for i in range(len(budgets_data)))
+        _set_column_widths(ws, widths)
+        
         # Título
-        ws['A1'] = "COMPARACIÓN DE PRESUPUESTOS"
-        ws['A1'].font = Font(size=16, bold=True, color="FFFFFF")
-        ws['A1'].fill = PatternFill(start_color="2E4057", end_color="2E4057", fill_type="solid")
-        ws.merge_cells('A1:F1')
+        ws.append([_styled_cell(ws, "COMPARACIÓN DE PRESUPUESTOS", font=_BANNER_FONT, fill=_BANNER_FILL)])
+        ws.merged_cells.add('A1:F1')
+        ws.append([])
         
         # Tabla comparativa
         headers = ['CONCEPTO'] + [budget.get('name', f"Presupuesto {i+1}") for i, budget in enumerate(budgets_data)]
         
-        # Escribir encabezados
-        for i, header in enumerate(headers):
-            cell = ws.cell(row=3, column=i+1, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center')
-        
         # Datos de comparación
         comparison_data = [
             ['Subtotal', 'total_amount - profit_amount'],
@@ -425,14 +462,22 @@ class ExcelExporter:
             ['Fecha de Creación', 'created_at']
         ]
         
+        # Los bordes cubren desde los encabezados (fila 3) hasta la fila 3 + len(comparison_data) - 1
+        last_border_row = 3 + len(comparison_data) - 1
+        
+        # Escribir encabezados
+        ws.append([
+            _styled_cell(ws, header, font=_HEADER_FONT, fill=_HEADER_FILL, alignment=_CENTER_ALIGN, border=_THIN_BORDER)
+            for header in headers
+        ])
+        
         for i, (concept, field) in enumerate(comparison_data):
             row = 4 + i
-            ws[f'A{row}'] = concept
-            ws[f'A{row}'].font = Font(bold=True)
+            border = _THIN_BORDER if row <= last_border_row else None
+            is_currency = field in ['total_amount - profit_amount', 'profit_amount', 'final_amount']
+            row_cells = [_styled_cell(ws, concept, font=_BOLD_FONT, border=border)]
             
-            for j, budget in enumerate(budgets_data):
-                col = j + 2
-                
+            for budget in budgets_data:
                 if field == 'total_amount - profit_amount':
                     value = budget.get('total_amount', 0) - budget.get('profit_amount', 0)
                 elif field == 'profit_amount':
@@ -451,21 +496,14 @@ class ExcelExporter:
                 else:
                     value = budget.get(field, '')
                 
-                ws.cell(row=row, column=col, value=value)
-                
                 # Formato de moneda para valores
-                if field in ['total_amount - profit_amount', 'profit_amount', 'final_amount']:
-                    ws.cell(row=row, column=col).number_format = '$#,##0.00'
-                    ws.cell(row=row, column=col).alignment = Alignment(horizontal='right')
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 25
-        for i in range(len(budgets_data)):
-            col_letter = chr(ord('B') + i)
-            ws.column_dimensions[col_letter].width = 15
-        
-        # Agregar bordes
-        self._add_borders_to_range(ws, f'A3:{chr(ord("A") + len(budgets_data))}{3 + len(comparison_data) - 1}')
+                if is_currency:
+                    row_cells.append(_styled_cell(ws, value, number_format=_CURRENCY_FORMAT,
+                                                  alignment=_RIGHT_ALIGN, border=border))
+                else:
+                    row_cells.append(_styled_cell(ws, value, border=border))
+            
+            ws.append(row_cells)
     
     def _create_comparison_analysis_sheet(self, budgets_data: List[Dict[str, Any]]):
         """Crea hoja de análisis de comparación"""
@@ -476,9 +514,12 @@ class ExcelExporter:
             budget1 = budgets_data[0]
             budget2 = budgets_data[1]
             
-            ws['A1'] = "ANÁLISIS DE VARIACIONES"
-            ws['A1'].font = Font(size=14, bold=True)
-            ws.merge_cells('A1:C1')
+            # Ajustar anchos de columna (antes de escribir filas)
+            _set_column_widths(ws, {'A': 25, 'B': 15, 'C': 15})
+            
+            ws.append([_styled_cell(ws, "ANÁLISIS DE VARIACIONES", font=_TITLE_FONT)])
+            ws.merged_cells.add('A1:C1')
+            ws.append([])
             
             # Calcular variaciones
             total_diff = budget2.get('final_amount', 0) - budget1.get('final_amount', 0)
@@ -490,162 +531,135 @@ class ExcelExporter:
             margin2 = (budget2.get('profit_amount', 0) / budget2.get('total_amount', 1) * 100)
             margin_diff = margin2 - margin1
             
-            # Escribir análisis
+            # Escribir análisis (con bordes en toda la tabla)
             analysis_data = [
                 ['Variación Total', f"${total_diff:,.2f}", f"{total_pct:.1f}%"],
                 ['Diferencia en Partidas', items_diff, 'partidas'],
                 ['Variación de Margen', f"{margin_diff:.1f}%", 'puntos'],
             ]
             
-            for i, (concept, value, unit) in enumerate(analysis_data):
-                row = 3 + i
-                ws[f'A{row}'] = concept
-                ws[f'B{row}'] = value
-                ws[f'C{row}'] = unit
-                ws[f'A{row}'].font = Font(bold=True)
-                ws[f'B{row}'].alignment = Alignment(horizontal='right')
-            
-            # Ajustar anchos de columna
-            ws.column_dimensions['A'].width = 25
-            ws.column_dimensions['B'].width = 15
-            ws.column_dimensions['C'].width = 15
-            
-            # Agregar bordes
-            self._add_borders_to_range(ws, f'A3:C{3 + len(analysis_data) - 1}')
+            for concept, value, unit in analysis_data:
+                ws.append([
+                    _styled_cell(ws, concept, font=_BOLD_FONT, border=_THIN_BORDER),
+                    _styled_cell(ws, value, alignment=_RIGHT_ALIGN, border=_THIN_BORDER),
+                    _styled_cell(ws, unit, border=_THIN_BORDER)
+                ])
     
     def _create_price_book_sheet(self, price_book_data: Dict[str, Any]):
         """Crea hoja de libro de precios"""
         
         ws = self.workbook.create_sheet("Precios")
+        entries = price_book_data.get('entries', [])
+        
+        # Ajustar anchos de columna (en modo de solo escritura, antes de escribir filas)
+        _set_column_widths(ws, {'A': 12, 'B': 40, 'C': 10, 'D': 15, 'E': 15, 'F': 25})
         
         # Información del libro de precios
-        ws['A1'] = f"Libro de Precios: {price_book_data.get('name', '')}"
-        ws['A1'].font = Font(size=14, bold=True)
-        ws.merge_cells('A1:F1')
+        ws.append([_styled_cell(ws, f"Libro de Precios: {price_book_data.get('name', '')}", font=_TITLE_FONT)])
+        ws.merged_cells.add('A1:F1')
         
-        ws['A2'] = f"Descripción: {price_book_data.get('description', '')}"
-        ws['A2'].font = Font(size=10)
-        ws.merge_cells('A2:F2')
+        ws.append([_styled_cell(ws, f"Descripción: {price_book_data.get('description', '')}", font=_SMALL_FONT)])
+        ws.merged_cells.add('A2:F2')
+        ws.append([])
+        
+        # La tabla (encabezados y precios) lleva bordes solo si hay entradas
+        border = _THIN_BORDER if entries else None
         
         # Encabezados
         headers = ['Código', 'Descripción', 'Unidad', 'Precio Unitario', 'Categoría', 'Notas']
-        for i, header in enumerate(headers):
-            cell = ws.cell(row=4, column=i+1, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Datos de precios
-        entries = price_book_data.get('entries', [])
-        for i, entry in enumerate(entries):
-            row = 5 + i
-            ws.cell(row=row, column=1, value=entry.get('code', ''))
-            ws.cell(row=row, column=2, value=entry.get('description', ''))
-            ws.cell(row=row, column=3, value=entry.get('unit', ''))
-            ws.cell(row=row, column=4, value=entry.get('unit_price', 0))
-            ws.cell(row=row, column=5, value=entry.get('category', ''))
-            ws.cell(row=row, column=6, value=entry.get('notes', ''))
-            
-            # Formato de moneda
-            ws[f'D{row}'].number_format = '$#,##0.00'
-            ws[f'D{row}'].alignment = Alignment(horizontal='right')
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 12
-        ws.column_dimensions['B'].width = 40
-        ws.column_dimensions['C'].width = 10
-        ws.column_dimensions['D'].width = 15
-        ws.column_dimensions['E'].width = 15
-        ws.column_dimensions['F'].width = 25
-        
-        # Agregar bordes
-        if entries:
-            self._add_borders_to_range(ws, f'A4:F{4 + len(entries)}')
+        ws.append([
+            _styled_cell(ws, header, font=_HEADER_FONT, fill=_HEADER_FILL, alignment=_CENTER_ALIGN, border=border)
+            for header in headers
+        ])
+        
+        # Datos de precios (celdas de tabla con borde mediante estilos con nombre)
+        for entry in entries:
+            get = entry.get
+            ws.append([
+                _styled_cell(ws, get('code', ''), style=_TABLE_STYLE),
+                _styled_cell(ws, get('description', ''), style=_TABLE_STYLE),
+                _styled_cell(ws, get('unit', ''), style=_TABLE_STYLE),
+                # Formato de moneda
+                _styled_cell(ws, get('unit_price', 0), style=_TABLE_CURRENCY_STYLE),
+                _styled_cell(ws, get('category', ''), style=_TABLE_STYLE),
+                _styled_cell(ws, get('notes', ''), style=_TABLE_STYLE)
+            ])
     
     def _create_price_book_stats_sheet(self, price_book_data: Dict[str, Any]):
         """Crea hoja de estadísticas del libro de precios"""
         
         ws = self.workbook.create_sheet("Estadísticas")
         
+        # Ajustar anchos de columna (antes de escribir filas)
+        _set_column_widths(ws, {'A': 20, 'B': 15})
+        
         # Título
-        ws['A1'] = "ESTADÍSTICAS DEL LIBRO DE PRECIOS"
-        ws['A1'].font = Font(size=14, bold=True)
-        ws.merge_cells('A1:C1')
+        ws.append([_styled_cell(ws, "ESTADÍSTICAS DEL LIBRO DE PRECIOS", font=_TITLE_FONT)])
+        ws.merged_cells.add('A1:C1')
         
         # Calcular estadísticas
         entries = price_book_data.get('entries', [])
         
         if entries:
-            prices = [entry.get('unit_price', 0) for entry in entries]
-            categories = list(set(entry.get('category', 'General') for entry in entries))
-            units = list(set(entry.get('unit', 'un') for entry in entries))
+            # Precios en un arreglo numpy: media, mínimo y máximo se calculan en C
+            prices = np.fromiter((entry.get('unit_price', 0) for entry in entries),
+                                 dtype=np.float64, count=len(entries))
+            num_categories = len({entry.get('category', 'General') for entry in entries})
+            num_units = len({entry.get('unit', 'un') for entry in entries})
             
             stats_data = [
                 ['Total de Partidas', len(entries)],
-                ['Precio Promedio', f"${sum(prices) / len(prices):,.2f}"],
-                ['Precio Mínimo', f"${min(prices):,.2f}"],
-                ['Precio Máximo', f"${max(prices):,.2f}"],
-                ['Número de Categorías', len(categories)],
-                ['Número de Unidades', len(units)]
+                ['Precio Promedio', f"${prices.mean():,.2f}"],
+                ['Precio Mínimo', f"${prices.min():,.2f}"],
+                ['Precio Máximo', f"${prices.max():,.2f}"],
+                ['Número de Categorías', num_categories],
+                ['Número de Unidades', num_units]
             ]
             
-            # Escribir estadísticas
-            for i, (stat, value) in enumerate(stats_data):
-                row = 3 + i
-                ws[f'A{row}'] = stat
-                ws[f'B{row}'] = value
-                ws[f'A{row}'].font = Font(bold=True)
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 20
-        ws.column_dimensions['B'].width = 15
+            # Escribir estadísticas a partir de la fila 3
+            ws.append([])
+            for stat, value in stats_data:
+                ws.append([_styled_cell(ws, stat, font=_BOLD_FONT), value])
     
     def _create_price_history_sheet(self, price_history: List[Dict[str, Any]]):
         """Crea hoja de histórico de precios"""
         
         ws = self.workbook.create_sheet("Histórico")
         
+        # Ajustar anchos de columna (antes de escribir filas)
+        _set_column_widths(ws, {'A': 12, 'B': 35, 'C': 15, 'D': 15, 'E': 18, 'F': 12, 'G': 30})
+        
+        # La tabla lleva bordes solo si hay histórico
+        border = _THIN_BORDER if price_history else None
+        
         # Encabezados
         headers = ['Código', 'Descripción', 'Precio Anterior', 'Precio Nuevo', 'Cambio', 'Fecha', 'Motivo']
-        for i, header in enumerate(headers):
-            cell = ws.cell(row=1, column=i+1, value=header)
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="34495E", end_color="34495E", fill_type="solid")
+        ws.append([
+            _styled_cell(ws, header, font=_HEADER_FONT, fill=_HEADER_FILL, border=border)
+            for header in headers
+        ])
         
         # Datos de histórico
-        for i, history_entry in enumerate(price_history):
-            row = 2 + i
-            ws.cell(row=row, column=1, value=history_entry.get('code', ''))
-            ws.cell(row=row, column=2, value=history_entry.get('description', ''))
-            ws.cell(row=row, column=3, value=history_entry.get('previous_price', 0))
-            ws.cell(row=row, column=4, value=history_entry.get('new_price', 0))
+        for history_entry in price_history:
+            get = history_entry.get
             
             # Calcular cambio
-            prev_price = history_entry.get('previous_price', 0)
-            new_price = history_entry.get('new_price', 0)
+            prev_price = get('previous_price', 0)
+            new_price = get('new_price', 0)
             change = new_price - prev_price
             change_pct = (change / prev_price * 100) if prev_price > 0 else 0
-            ws.cell(row=row, column=5, value=f"${change:,.2f} ({change_pct:+.1f}%)")
-            
-            ws.cell(row=row, column=6, value=history_entry.get('change_date', ''))
-            ws.cell(row=row, column=7, value=history_entry.get('change_reason', ''))
-            
-            # Formato de moneda
-            ws[f'C{row}'].number_format = '$#,##0.00'
-            ws[f'D{row}'].number_format = '$#,##0.00'
-        
-        # Ajustar anchos de columna
-        ws.column_dimensions['A'].width = 12
-        ws.column_dimensions['B'].width = 35
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 15
-        ws.column_dimensions['E'].width = 18
-        ws.column_dimensions['F'].width = 12
-        ws.column_dimensions['G'].width = 30
-        
-        # Agregar bordes
-        if price_history:
-            self._add_borders_to_range(ws, f'A1:G{1 + len(price_history)}')
+            
+            # Celdas de tabla con borde mediante el estilo con nombre
+            ws.append([
+                _styled_cell(ws, get('code', ''), style=_TABLE_STYLE),
+                _styled_cell(ws, get('description', ''), style=_TABLE_STYLE),
+                # Formato de moneda
+                _styled_cell(ws, prev_price, style=_TABLE_STYLE, number_format=_CURRENCY_FORMAT),
+                _styled_cell(ws, new_price, style=_TABLE_STYLE, number_format=_CURRENCY_FORMAT),
+                _styled_cell(ws, f"${change:,.2f} ({change_pct:+.1f}%)", style=_TABLE_STYLE),
+                _styled_cell(ws, get('change_date', ''), style=_TABLE_STYLE),
+                _styled_cell(ws, get('change_reason', ''), style=_TABLE_STYLE)
+            ])
     
     def _group_items_by_chapter(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Agrupa items por capítulo"""
@@ -666,17 +680,3 @@ class ExcelExporter:
             chapters[chapter]['total'] += float(item.get('total_price', 0))
         
         return chapters
-    
-    def _add_borders_to_range(self, worksheet, range_string: str):
-        """Agrega bordes a un rango de celdas"""
-        
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        for row in worksheet[range_string]:
-            for cell in row:
-                cell.border = thin_border
\ No newline at end of file
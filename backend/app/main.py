@@ -1,10 +1,15 @@
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
-from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, insert
+from typing import List, Optional, Dict, Any, Tuple
 import os
 import shutil
+import time
+import numpy as np
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
 import logging
@@ -49,6 +54,30 @@ OUTPUT_DIR = Path("outputs")
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+def _file_stamp() -> str:
+    """Genera un identificador hexadecimal único para nombres de archivo"""
+    return format(time.time_ns(), 'x')
+
+# Procesadores de PDF compartidos (se inicializan una sola vez al arrancar)
+_PDF_READER = PDFReader(cache_dir=str(UPLOAD_DIR / ".pdf_cache"))
+_OCR = OCRProcessor()
+_EXTRACTOR = DataExtractor()
+_FORMAT_DETECTOR = FormatDetector()
+
+@app.on_event("shutdown")
+def _shutdown_pdf_pipeline():
+    """Detiene los procesos de trabajo del lector de PDF al apagar la API"""
+    _PDF_READER.close()
+
+def get_pdf_pipeline() -> Dict[str, Any]:
+    """Dependency que devuelve los procesadores de PDF compartidos"""
+    return {
+        "pdf_reader": _PDF_READER,
+        "ocr_processor": _OCR,
+        "data_extractor": _EXTRACTOR,
+        "format_detector": _FORMAT_DETECTOR
+    }
+
 # Rutas de la API
 @app.get("/")
 async def root():
@@ -160,7 +189,8 @@ async def get_budget(budget_id: int, db: Session = Depends(get_db)):
 async def upload_pdf(
     file: UploadFile = File(...),
     project_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    pipeline: Dict[str, Any] = Depends(get_pdf_pipeline)
 ):
     """Sube y procesa un archivo PDF de presupuesto"""
     try:
@@ -169,18 +199,18 @@ async def upload_pdf(
             raise HTTPException(status_code=400, detail="Solo se aceptan archivos PDF")
         
         # Guardar archivo
-        file_path = UPLOAD_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
+        file_path = UPLOAD_DIR / f"{_file_stamp()}_{file.filename}"
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
         # Procesar PDF
-        pdf_reader = PDFReader()
-        ocr_processor = OCRProcessor()
-        data_extractor = DataExtractor()
-        format_detector = FormatDetector()
+        pdf_reader = pipeline["pdf_reader"]
+        ocr_processor = pipeline["ocr_processor"]
+        data_extractor = pipeline["data_extractor"]
+        format_detector = pipeline["format_detector"]
         
-        # Leer PDF
-        pdf_data = pdf_reader.read_pdf(str(file_path))
+        # Leer PDF (trabajo de CPU fuera del event loop)
+        pdf_data = await run_in_threadpool(pdf_reader.read_pdf, str(file_path), include_pages=False)
         
         # Aplicar OCR si es necesario
         if pdf_data['is_scanned']:
@@ -190,10 +220,13 @@ async def upload_pdf(
             pdf_data['extracted_text'] = ocr_result['text']
         
         # Detectar formato
-        format_analysis = format_detector.detect_format(pdf_data['extracted_text'])
+        format_analysis = await run_in_threadpool(
+            format_detector.detect_format, pdf_data['extracted_text']
+        )
         
         # Extraer partidas
-        budget_items = data_extractor.extract_budget_items(
+        budget_items = await run_in_threadpool(
+            data_extractor.extract_budget_items,
             pdf_data['extracted_text'], 
             format_analysis['detected_format']
         )
@@ -212,20 +245,23 @@ async def upload_pdf(
         db.commit()
         db.refresh(db_budget)
         
-        # Crear items del presupuesto
-        for item_data in budget_items:
-            budget_item = BudgetItem(
-                budget_id=db_budget.id,
-                chapter=item_data.get('chapter', ''),
-                code=item_data.get('code', ''),
-                description=item_data.get('description', ''),
-                unit=item_data.get('unit', ''),
-                quantity=Decimal(str(item_data.get('quantity', 0))),
-                unit_price=Decimal(str(item_data.get('unit_price', 0))),
-                total_price=Decimal(str(item_data.get('total_price', 0))),
-                performance_rate=Decimal('1.0')
-            )
-            db.add(budget_item)
+        # Crear items del presupuesto con un único INSERT por lotes (executemany),
+        # sin construir un objeto ORM por partida
+        if budget_items:
+            db.execute(insert(BudgetItem), [
+                {
+                    'budget_id': db_budget.id,
+                    'chapter': item_data.get('chapter', ''),
+                    'code': item_data.get('code', ''),
+                    'description': item_data.get('description', ''),
+                    'unit': item_data.get('unit', ''),
+                    'quantity': Decimal(str(item_data.get('quantity', 0))),
+                    'unit_price': Decimal(str(item_data.get('unit_price', 0))),
+                    'total_price': Decimal(str(item_data.get('total_price', 0))),
+                    'performance_rate': Decimal('1.0')
+                }
+                for item_data in budget_items
+            ])
         
         db.commit()
         
@@ -352,11 +388,26 @@ async def export_budget_pdf(
 ):
     """Exporta un presupuesto a PDF"""
     try:
-        # Obtener datos del presupuesto
-        budget = db.query(Budget).filter(Budget.id == budget_id).first()
+        # Obtener datos del presupuesto con proyecto, compañía y partidas precargados
+        budget = db.query(Budget).options(
+            joinedload(Budget.project).joinedload(Project.company),
+            selectinload(Budget.items)
+        ).filter(Budget.id == budget_id).first()
         if not budget:
             raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
         
+        # Desglose de costos vectorizado (valores solo de presentación, basta con float)
+        items = budget.items
+        item_totals = np.fromiter((float(item.total_price) for item in items), dtype=np.float64, count=len(items))
+        item_percentages = np.array(
+            [
+                (float(item.labor_percentage), float(item.material_percentage), float(item.equipment_percentage))
+                for item in items
+            ],
+            dtype=np.float64
+        ).reshape(len(items), 3)
+        labor_cost, material_cost, equipment_cost = (item_totals @ item_percentages / 100.0).tolist()
+        
         # Preparar datos para exportación
         budget_data = {
             "id": budget.id,
@@ -388,19 +439,19 @@ async def export_budget_pdf(
                     "material_percentage": item.material_percentage,
                     "equipment_percentage": item.equipment_percentage
                 }
-                for item in budget.items
+                for item in items
             ],
             "cost_breakdown": {
-                "labor_cost": sum(item.total_price * item.labor_percentage / 100 for item in budget.items),
-                "material_cost": sum(item.total_price * item.material_percentage / 100 for item in budget.items),
-                "equipment_cost": sum(item.total_price * item.equipment_percentage / 100 for item in budget.items),
+                "labor_cost": labor_cost,
+                "material_cost": material_cost,
+                "equipment_cost": equipment_cost,
                 "indirect_cost": budget.total_amount * 0.1,  # Ejemplo
                 "profit_amount": budget.profit_amount
             }
         }
         
         # Generar PDF
-        output_path = OUTPUT_DIR / f"budget_{budget_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        output_path = OUTPUT_DIR / f"budget_{budget_id}_{_file_stamp()}.pdf"
         pdf_generator = PDFGenerator()
         
         success = pdf_generator.generate_budget_pdf(
@@ -430,8 +481,11 @@ async def export_budget_excel(
 ):
     """Exporta un presupuesto a Excel"""
     try:
-        # Obtener datos del presupuesto
-        budget = db.query(Budget).filter(Budget.id == budget_id).first()
+        # Obtener datos del presupuesto con proyecto, compañía y partidas precargados
+        budget = db.query(Budget).options(
+            joinedload(Budget.project).joinedload(Project.company),
+            selectinload(Budget.items)
+        ).filter(Budget.id == budget_id).first()
         if not budget:
             raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
         
@@ -462,7 +516,7 @@ async def export_budget_excel(
         }
         
         # Generar Excel
-        output_path = OUTPUT_DIR / f"budget_{budget_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        output_path = OUTPUT_DIR / f"budget_{budget_id}_{_file_stamp()}.xlsx"
         excel_exporter = ExcelExporter()
         
         success = excel_exporter.export_budget_to_excel(
@@ -485,11 +539,31 @@ async def export_budget_excel(
 
 # ===== ENDPOINTS DE DASHBOARD =====
 
+# Caché LRU de métricas por compañía: company_id -> (instante de cálculo, métricas).
+# Acotada, porque company_id llega directamente de la query string
+_METRICS_CACHE: "OrderedDict[Optional[int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_METRICS_CACHE_SIZE = 128
+_METRICS_TTL = 60  # segundos
+
+def _month_start(reference: datetime, months_back: int) -> datetime:
+    """Devuelve el primer día del mes situado `months_back` meses antes de `reference`"""
+    month_index = reference.year * 12 + reference.month - 1 - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
 @app.get("/dashboard/metrics")
 async def get_dashboard_metrics(company_id: Optional[int] = None, 
                               db: Session = Depends(get_db)):
     """Obtiene métricas para el dashboard"""
     try:
+        cached = _METRICS_CACHE.get(company_id)
+        if cached is not None:
+            cached_at, cached_metrics = cached
+            if time.monotonic() - cached_at < _METRICS_TTL:
+                _METRICS_CACHE.move_to_end(company_id)
+                return cached_metrics
+            # Entrada caducada: se descarta y se recalcula
+            del _METRICS_CACHE[company_id]
+        
         # Query base
         query = db.query(Budget)
         if company_id:
@@ -511,24 +585,43 @@ async def get_dashboard_metrics(company_id: Optional[int] = None,
         else:
             avg_profit_margin = 0
         
-        # Tendencia mensual (simplificada)
+        # Tendencia mensual de los últimos 6 meses agregada en la base de datos
+        now = datetime.now()
+        month_column = func.date_trunc('month', Budget.created_at).label('month')
+        trend_query = db.query(
+            month_column,
+            func.coalesce(func.sum(Budget.final_amount), 0),
+            func.count(Budget.id)
+        ).filter(Budget.created_at >= _month_start(now, 5))
+        if company_id:
+            trend_query = trend_query.join(Project).filter(Project.company_id == company_id)
+        trend_rows = {
+            month.strftime("%Y-%m"): (total, count)
+            for month, total, count in trend_query.group_by(month_column).all()
+        }
+        
         monthly_trend = []
         for month in range(6):
-            month_date = datetime.now().replace(day=1) - pd.DateOffset(months=month)
-            month_budgets = [b for b in budgets if b.created_at.month == month_date.month]
+            month_key = _month_start(now, month).strftime("%Y-%m")
+            month_total, month_count = trend_rows.get(month_key, (0, 0))
             monthly_trend.append({
-                "month": month_date.strftime("%Y-%m"),
-                "total": sum(b.final_amount for b in month_budgets),
-                "count": len(month_budgets)
+                "month": month_key,
+                "total": month_total,
+                "count": month_count
             })
         
-        return {
+        metrics = {
             "total_projects": total_projects,
             "active_budgets": active_budgets,
             "total_amount": total_amount,
             "average_profit_margin": avg_profit_margin,
             "monthly_trend": monthly_trend
         }
+        _METRICS_CACHE[company_id] = (time.monotonic(), metrics)
+        if len(_METRICS_CACHE) > _METRICS_CACHE_SIZE:
+            _METRICS_CACHE.popitem(last=False)
+        
+        return metrics
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,8 +1,22 @@
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, BeforeValidator
+from typing import Optional, List, Dict, Any, Annotated, Literal
 from datetime import datetime, date
 from decimal import Decimal
 
+def _round_decimal(v: Any) -> Any:
+    """Redondea importes a 2 decimales antes de validarlos"""
+    if v is not None:
+        return round(Decimal(str(v)), 2)
+    return v
+
+# Decimal redondeado a 2 decimales, reutilizable en cualquier campo
+_RoundedDecimal = Annotated[Decimal, BeforeValidator(_round_decimal)]
+
+# Valores permitidos para campos de estado y formato
+ProjectStatus = Literal['draft', 'active', 'completed', 'cancelled']
+BudgetStatus = Literal['draft', 'approved', 'rejected']
+ExportFormat = Literal['pdf', 'excel', 'csv']
+
 # Schemas base
 class BaseSchema(BaseModel):
     class Config:
@@ -43,7 +57,7 @@ class ProjectUpdate(BaseSchema):
     client_name: Optional[str] = Field(None, max_length=255)
     location: Optional[str] = Field(None, max_length=500)
     profit_margin: Optional[Decimal] = Field(None, ge=0, le=100)
-    status: Optional[str] = Field(None, regex="^(draft|active|completed|cancelled)$")
+    status: Optional[ProjectStatus] = None
 
 class Project(ProjectBase):
     id: int
@@ -64,7 +78,7 @@ class BudgetCreate(BudgetBase):
 class BudgetUpdate(BaseSchema):
     name: Optional[str] = Field(None, min_length=1, max_length=255)
     description: Optional[str] = None
-    status: Optional[str] = Field(None, regex="^(draft|approved|rejected)$")
+    status: Optional[BudgetStatus] = None
 
 class Budget(BudgetBase):
     id: int
@@ -104,19 +118,13 @@ class BudgetItemUpdate(BaseSchema):
 class BudgetItem(BudgetItemBase):
     id: int
     budget_id: int
-    total_price: Decimal
-    labor_cost: Decimal
-    material_cost: Decimal
-    equipment_cost: Decimal
-    indirect_cost: Decimal
+    total_price: _RoundedDecimal
+    labor_cost: _RoundedDecimal
+    material_cost: _RoundedDecimal
+    equipment_cost: _RoundedDecimal
+    indirect_cost: _RoundedDecimal
     order_index: int
 
-    @validator('total_price', 'labor_cost', 'material_cost', 'equipment_cost', 'indirect_cost', pre=True, always=True)
-    def round_decimals(cls, v):
-        if v is not None:
-            return round(Decimal(str(v)), 2)
-        return v
-
 # PriceBook schemas
 class PriceBookBase(BaseSchema):
     name: str = Field(..., min_length=1, max_length=255)
@@ -220,6 +228,6 @@ class PriceComparison(BaseSchema):
 # Export schemas
 class ExportRequest(BaseSchema):
     budget_id: int
-    format: str = Field(..., regex="^(pdf|excel|csv)$")
+    format: ExportFormat
     include_logo: bool = True
     template: Optional[str] = None
\ No newline at end of file
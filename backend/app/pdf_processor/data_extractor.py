@@ -1,25 +1,140 @@
 import re
-from typing import Dict, List, Any, Optional, Tuple
+import sys
+from typing import Dict, List, Any, Optional, Set, Tuple
 import logging
 from datetime import datetime
 from decimal import Decimal
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+def _to_cents(amount: str) -> Optional[int]:
+    """Convierte un importe ('$1,234.56', '1234.5', ...) a céntimos enteros"""
+    whole, _, fraction = amount.replace('$', '').replace(',', '').partition('.')
+    if not (whole or fraction) or not (whole.isdigit() or not whole) or not (fraction.isdigit() or not fraction):
+        return None
+    
+    cents = int(whole or 0) * 100 + int(fraction[:2].ljust(2, '0'))
+    # Redondeo half-up del tercer decimal
+    if len(fraction) > 2 and fraction[2] >= '5':
+        cents += 1
+    return cents
+
+def _cents_to_decimal(cents: int) -> Decimal:
+    """Convierte céntimos enteros a Decimal con dos decimales"""
+    return Decimal(cents).scaleb(-2)
+
+def _lines_with_digits(lines: List[str]) -> List[str]:
+    """
+    Filtra las líneas que contienen algún dígito con un único recorrido vectorizado.
+    Las líneas con caracteres no ASCII se conservan (pueden tener dígitos Unicode).
+    """
+    if not lines:
+        return []
+    
+    buf = np.frombuffer('\n'.join(lines).encode('utf-8'), dtype=np.uint8)
+    newlines = np.flatnonzero(buf == 0x0A)
+    if len(newlines) != len(lines) - 1:
+        # Alguna línea trae saltos internos; no se puede mapear byte a línea
+        return lines
+    
+    flags = ((buf >= 0x30) & (buf <= 0x39)) | (buf >= 0x80)
+    cumulative = np.concatenate(([0], np.cumsum(flags)))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, len(buf))
+    candidates = np.flatnonzero(cumulative[ends] - cumulative[starts])
+    return [lines[i] for i in candidates]
+
 class DataExtractor:
     """Extrae datos estructurados de presupuestos de construcción"""
     
-    def __init__(self):
-        self.common_units = {
-            'm2', 'm3', 'kg', 'ml', 'l', 'un', 'hm', 'km', 'm', 'pieza', 'juego', 'global',
-            'metros', 'kilogramos', 'litros', 'unidades', 'metros cuadrados', 'metros cúbicos'
-        }
-        
-        self.currency_patterns = [
-            r'\$?\d{1,3}(?:,\d{3})*\.?\d{0,2}',  # $1,234.56 o 1234.56
-            r'\d{1,3}(?:\.\d{3})*,\d{2}',         # 1.234,56
-            r'\b\d+\.\d{2}\b'                    # 123.45
-        ]
+    # Expresiones regulares precompiladas (se compilan una sola vez por proceso)
+    _RE_WS = re.compile(r'\s+')
+    _RE_HSPACE = re.compile(r'[^\S\n]+')
+    _RE_NL = re.compile(r'\s*\n\s*')
+    _RE_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+    _RE_CODE_ALPHA = re.compile(r'^\s*[A-Z]{2,3}\d{2,4}')
+    _RE_CODE_EXACT = re.compile(r'^\d+(?:\.\d+)*$')
+    _RE_CODE_WORD = re.compile(r'\b(\d+(?:\.\d+)*)\b')
+    _RE_QTY_UNIT = re.compile(r'(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)\b', re.IGNORECASE)
+    _RE_QTY_UNIT_WORD = re.compile(r'\b(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)\b', re.IGNORECASE)
+    _RE_UNIT = re.compile(r'\b(m2|m3|kg|ml|l|un|m)\b', re.IGNORECASE)
+    _RE_TABLE_SPLIT = re.compile(r'\s{2,}|\t')
+    _RE_ALPHA_START = re.compile(r'[a-zA-Z]')
+    
+    # Importes en un único patrón: $1,234.56 o 1234.56 | 1.234,56 | 123.45
+    _RE_CURRENCY = re.compile(
+        r'\$?\d{1,3}(?:,\d{3})*\.?\d{0,2}'
+        r'|\d{1,3}(?:\.\d{3})*,\d{2}'
+        r'|\b\d+\.\d{2}\b'
+    )
+    # Decimales exactos (123.45); la primera alternativa de _RE_CURRENCY los trocea a partir de 1000
+    _RE_DECIMAL_AMOUNT = re.compile(r'\b\d+\.\d{2}\b')
+    
+    # Patrón común: Código Descripción Cantidad Unidad Precio, agrupados por el
+    # primer carácter del código y en orden de prioridad dentro de cada grupo
+    _LIST_ITEM_NUMERIC_RES = (
+        # Formato: 01.01.01 Descripción 100 m2 $50.00
+        re.compile(r'(\d+(?:\.\d+)*)\s+(.+?)\s+(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)\s+([$\d,\.]+)', re.IGNORECASE),
+        # Formato: 001 Descripción 100 50.00
+        re.compile(r'(\d+)\s+(.+?)\s+(\d+(?:\.\d+)?)\s+([$\d,\.]+)', re.IGNORECASE)
+    )
+    _LIST_ITEM_ALPHA_RES = (
+        # Formato: AB1234 Descripción 100 m2
+        re.compile(r'([A-Z]{2,3}\d{2,4})\s+(.+?)\s+(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)', re.IGNORECASE),
+    )
+    
+    # Patrones para diferentes formatos de presupuesto, sobre el texto codificado en UTF-8.
+    # Todos los delimitadores son ASCII, así que los caracteres multibyte solo pueden caer
+    # dentro de las descripciones. Los dos formatos con código van unidos en una sola
+    # pasada; cada alternativa lleva un prefijo (a_, b_, c_) en sus grupos para saber cuál casó
+    _RE_BUDGET_ITEM = re.compile(
+        # Formato complejo con múltiples campos
+        rb'(?P<a_code>\d+(?:\.\d+)*)\s+(?P<a_desc>.+?)\s+(?P<a_qty>\d+(?:\.\d+)?)\s*(?P<a_unit>m2|m3|kg|ml|l|un|m)\s+(?P<a_uprice>\d+(?:\.\d{2})?)\s+(?P<a_total>\d+(?:\.\d{2})?)'
+        # Formato con código y cantidad
+        rb'|(?P<b_code>[A-Z]{2,3}\d{2,4})\s+(?P<b_desc>.+?)\s+(?P<b_qty>\d+(?:\.\d+)?)\s+(?P<b_unit>m2|m3|kg|ml|l|un|m)',
+        re.IGNORECASE | re.MULTILINE
+    )
+    # Formato simple con descripción y precio. Su descripción puede empezar en cualquier
+    # punto de la línea, así que solo se busca en los tramos que no cubren los formatos
+    # con código (si no, se comería la partida desde el inicio de la línea)
+    _RE_BUDGET_ITEM_SIMPLE = re.compile(
+        rb'(?P<c_desc>.+?)\s+(?P<c_qty>\d+(?:\.\d+)?)\s*(?P<c_unit>m2|m3|kg|ml|l|un|m)\s+(?P<c_price>\d+(?:\.\d{2})?)',
+        re.IGNORECASE | re.MULTILINE
+    )
+    
+    # Palabras clave de totales por campo, en orden de prioridad
+    _TOTAL_KEYWORDS = (
+        ('subtotal', ('SUBTOTAL', 'SUB-TOTAL', 'SUB TOTAL')),
+        ('tax', ('IVA', 'TAX', 'IMPUESTO')),
+        ('total', ('TOTAL GENERAL', 'TOTAL')),
+        ('profit', ('BENEFICIO', 'GANANCIA', 'PROFIT'))
+    )
+    
+    # Caracteres de control -> espacio, salvo el salto de línea
+    _CTRL_TABLE = {
+        code: ' ' for code in [*range(0x00, 0x20), *range(0x7f, 0xa0)] if code != ord('\n')
+    }
+    
+    # Unidades reconocidas (en minúsculas) y su forma normalizada
+    _COMMON_UNITS = frozenset({
+        'm2', 'm3', 'kg', 'ml', 'l', 'un', 'hm', 'km', 'm', 'pieza', 'juego', 'global',
+        'metros', 'kilogramos', 'litros', 'unidades', 'metros cuadrados', 'metros cúbicos'
+    })
+    _UNIT_MAPPING = {
+        'metros cuadrados': 'm2',
+        'metros cúbicos': 'm3',
+        'kilogramos': 'kg',
+        'litros': 'l',
+        'unidades': 'un',
+        'metros': 'm'
+    }
+    # Instancias únicas de cada unidad para no guardar un recorte nuevo por partida
+    _UNIT_INTERN = {
+        variant: sys.intern(variant)
+        for unit in _COMMON_UNITS
+        for variant in (unit, unit.upper())
+    }
     
     def extract_budget_items(self, text: str, format_type: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -65,14 +180,14 @@ class DataExtractor:
     
     def _clean_text(self, text: str) -> str:
         """Limpia y normaliza el texto"""
-        # Eliminar caracteres de control
-        text = re.sub(r'[\x00-\x1f\x7f-\x9f]', ' ', text)
+        # Sustituir caracteres de control en una sola pasada
+        text = text.translate(self._CTRL_TABLE)
         
-        # Normalizar espacios
-        text = re.sub(r'\s+', ' ', text)
+        # Normalizar espacios sin perder los saltos de línea
+        text = self._RE_HSPACE.sub(' ', text)
         
         # Normalizar saltos de línea
-        text = re.sub(r'\n+', '\n', text)
+        text = self._RE_NL.sub('\n', text)
         
         return text.strip()
     
@@ -81,46 +196,63 @@ class DataExtractor:
         if len(lines) < 3:
             return "unknown"
         
+        # Umbrales de predominancia
+        table_threshold = len(lines) * 0.6
+        list_threshold = len(lines) * 0.4
+        
         # Contar líneas que parecen ser filas de tabla
         table_lines = 0
         list_lines = 0
         
-        for line in lines:
+        for index, line in enumerate(lines):
+            remaining = len(lines) - index - 1
+            
             # Patrón de tabla: múltiples columnas de números
             if self._is_table_row(line):
                 table_lines += 1
+                if table_lines > table_threshold:
+                    return "table"
             # Patrón de lista: código + descripción + cantidad
             elif self._is_list_item(line):
                 list_lines += 1
+            
+            # Cortar en cuanto el resultado ya no puede cambiar
+            if table_lines + remaining <= table_threshold:
+                if list_lines > list_threshold:
+                    return "list"
+                if list_lines + remaining <= list_threshold:
+                    return "mixed"
         
         # Determinar formato basado en predominancia
-        if table_lines > len(lines) * 0.6:
+        if table_lines > table_threshold:
             return "table"
-        elif list_lines > len(lines) * 0.4:
+        elif list_lines > list_threshold:
             return "list"
         else:
             return "mixed"
     
     def _is_table_row(self, line: str) -> bool:
         """Determina si una línea parece ser una fila de tabla"""
+        # Descartar primero con el conteo de palabras, que no pasa por el motor de regex
+        if len(line.split()) < 4:
+            return False
+        
         # Buscar múltiples números separados por espacios o tabulaciones
-        numbers = re.findall(r'\d+(?:\.\d+)?', line)
-        return len(numbers) >= 3 and len(line.split()) >= 4
+        return len(self._RE_NUMBER.findall(line)) >= 3
     
     def _is_list_item(self, line: str) -> bool:
         """Determina si una línea parece ser un item de lista"""
-        # Buscar patrón: código + texto + número + unidad
-        has_code = re.match(r'^\s*\d+(?:\.\d+)*', line) is not None
-        has_number = re.search(r'\d+(?:\.\d+)?\s*(?:m2|m3|kg|ml|l|un|m)\b', line, re.IGNORECASE) is not None
-        has_price = any(re.search(pattern, line) for pattern in self.currency_patterns)
-        
-        return has_code and (has_number or has_price)
+        # Buscar patrón: código + texto + número + unidad. Un código inicial ya
+        # implica un número, y la primera alternativa de _RE_CURRENCY casa con
+        # cualquier número, así que basta con mirar el primer carácter no blanco
+        return line.lstrip()[:1].isdecimal()
     
     def _extract_from_table(self, lines: List[str]) -> List[Dict[str, Any]]:
         """Extrae partidas de formato de tabla"""
         items = []
         
-        for line in lines:
+        # Sin dígitos no puede haber cantidad ni precio, así que esas filas se descartan de antemano
+        for line in _lines_with_digits(lines):
             # Intentar dividir la línea en columnas
             columns = self._split_table_row(line)
             
@@ -134,7 +266,7 @@ class DataExtractor:
     def _split_table_row(self, line: str) -> List[str]:
         """Divide una fila de tabla en columnas"""
         # Intentar dividir por múltiples espacios o tabulaciones
-        columns = re.split(r'\s{2,}|\t', line.strip())
+        columns = self._RE_TABLE_SPLIT.split(line.strip())
         
         # Filtrar columnas vacías
         columns = [col.strip() for col in columns if col.strip()]
@@ -155,7 +287,7 @@ class DataExtractor:
             
             # Buscar código (primera columna que parezca un código)
             for i, col in enumerate(columns[:2]):  # Solo las primeras 2 columnas
-                if re.match(r'^\d+(?:\.\d+)*$', col):
+                if self._RE_CODE_EXACT.match(col):
                     item['code'] = col
                     # La siguiente columna probablemente sea la descripción
                     if i + 1 < len(columns):
@@ -169,37 +301,32 @@ class DataExtractor:
             # Buscar unidad y cantidad
             for col in columns:
                 # Buscar cantidad con unidad
-                qty_match = re.search(r'(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)\b', col, re.IGNORECASE)
+                qty_match = self._RE_QTY_UNIT.search(col)
                 if qty_match and not item['quantity']:
                     item['quantity'] = Decimal(qty_match.group(1))
                     item['unit'] = qty_match.group(2)
                 
                 # Buscar solo unidad
-                unit_match = re.search(r'\b(m2|m3|kg|ml|l|un|m)\b', col, re.IGNORECASE)
+                unit_match = self._RE_UNIT.search(col)
                 if unit_match and not item['unit']:
                     item['unit'] = unit_match.group(1)
             
-            # Buscar precios
+            # Buscar precios (en céntimos enteros; se pasan a Decimal al asignarlos)
             prices = []
             for col in columns:
-                for pattern in self.currency_patterns:
-                    price_matches = re.findall(pattern, col)
-                    for price in price_matches:
-                        try:
-                            clean_price = price.replace('$', '').replace(',', '')
-                            prices.append(Decimal(clean_price))
-                        except:
-                            pass
+                for price in self._RE_CURRENCY.findall(col) + self._RE_DECIMAL_AMOUNT.findall(col):
+                    cents = _to_cents(price)
+                    if cents is not None:
+                        prices.append(cents)
             
             # Asignar precios basándose en valores y posición
             if len(prices) >= 2:
                 # Asumir que el menor es precio unitario, mayor es total
-                prices_sorted = sorted(prices)
-                item['unit_price'] = prices_sorted[0]
-                item['total_price'] = prices_sorted[-1]
+                item['unit_price'] = _cents_to_decimal(min(prices))
+                item['total_price'] = _cents_to_decimal(max(prices))
             elif len(prices) == 1:
                 # Solo un precio, asumir que es unitario
-                item['unit_price'] = prices[0]
+                item['unit_price'] = _cents_to_decimal(prices[0])
                 if item['quantity']:
                     item['total_price'] = item['quantity'] * item['unit_price']
             
@@ -217,6 +344,7 @@ class DataExtractor:
         """Extrae partidas de formato de lista"""
         items = []
         current_item = None
+        description_parts = []
         
         for line in lines:
             # Buscar inicio de nueva partida
@@ -225,16 +353,20 @@ class DataExtractor:
             if new_item:
                 # Guardar item anterior si existe
                 if current_item:
+                    current_item['description'] = ' '.join(description_parts)
                     items.append(current_item)
                 
                 current_item = new_item
+                description_parts = [new_item['description']]
             elif current_item:
                 # Si no es nueva partida, puede ser continuación de descripción
-                if len(line.strip()) > 10 and not line.strip()[0].isdigit():
-                    current_item['description'] += ' ' + line.strip()
+                stripped = line.strip()
+                if len(stripped) > 10 and not stripped[0].isdigit():
+                    description_parts.append(stripped)
         
         # Guardar último item
         if current_item:
+            current_item['description'] = ' '.join(description_parts)
             items.append(current_item)
         
         return items
@@ -242,39 +374,30 @@ class DataExtractor:
     def _parse_list_item(self, line: str) -> Optional[Dict[str, Any]]:
         """Parsea una línea de lista en una partida"""
         line = line.strip()
-        if not line:
+        # Todos los patrones empiezan por un código (dígito o letra): las
+        # líneas de continuación se descartan sin pasar por el motor de regex
+        if not line or not (line[0].isdecimal() or line[0].isalpha()):
             return None
         
-        # Patrón común: Código Descripción Cantidad Unidad Precio
-        patterns = [
-            # Formato: 01.01.01 Descripción 100 m2 $50.00
-            r'^(\d+(?:\.\d+)*)\s+(.+?)\s+(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)\s+([$\d,\.]+)',
-            # Formato: 001 Descripción 100 50.00
-            r'^(\d+)\s+(.+?)\s+(\d+(?:\.\d+)?)\s+([$\d,\.]+)',
-            # Formato: AB1234 Descripción 100 m2
-            r'^([A-Z]{2,3}\d{2,4})\s+(.+?)\s+(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)'
-        ]
-        
+        patterns = self._LIST_ITEM_NUMERIC_RES if line[0].isdecimal() else self._LIST_ITEM_ALPHA_RES
         for pattern in patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
+            match = pattern.match(line)
             if match:
                 groups = match.groups()
                 item = {
                     'code': groups[0],
                     'description': groups[1].strip(),
                     'quantity': Decimal(groups[2]) if len(groups) > 2 else None,
-                    'unit': groups[3] if len(groups) > 3 and groups[3] in self.common_units else '',
+                    'unit': groups[3] if len(groups) > 3 and groups[3].lower() in self._COMMON_UNITS else '',
                     'unit_price': None,
                     'total_price': None
                 }
                 
                 # Buscar precio adicional
                 if len(groups) > 4:
-                    try:
-                        price_str = groups[4].replace('$', '').replace(',', '')
-                        item['unit_price'] = Decimal(price_str)
-                    except:
-                        pass
+                    cents = _to_cents(groups[4])
+                    if cents is not None:
+                        item['unit_price'] = _cents_to_decimal(cents)
                 
                 return item
         
@@ -284,18 +407,22 @@ class DataExtractor:
         """Extrae partidas de formato mixto usando múltiples estrategias"""
         items = []
         
-        # Intentar diferentes estrategias
+        # Estrategias de la más barata a la más costosa; se detiene en cuanto
+        # una alcanza un rendimiento suficiente
         strategies = [
+            self._extract_with_patterns,
             self._extract_with_line_breaks,
-            self._extract_with_context,
-            self._extract_with_patterns
+            self._extract_with_context
         ]
+        target = max(len(lines) // 20, 10)
         
         for strategy in strategies:
             try:
                 strategy_items = strategy(lines)
                 if len(strategy_items) > len(items):
                     items = strategy_items
+                if len(items) >= target:
+                    break
             except Exception as e:
                 logger.warning(f"Estrategia {strategy.__name__} falló: {str(e)}")
                 continue
@@ -333,12 +460,14 @@ class DataExtractor:
     
     def _is_new_item_line(self, line: str) -> bool:
         """Determina si una línea parece ser el inicio de una nueva partida"""
+        first_char = line.lstrip()[:1]
+        
         # Comienza con código
-        if re.match(r'^\s*\d+(?:\.\d+)*', line):
+        if first_char.isdecimal():
             return True
         
         # Comienza con patrón de código de obra
-        if re.match(r'^\s*[A-Z]{2,3}\d{2,4}', line):
+        if 'A' <= first_char <= 'Z' and self._RE_CODE_ALPHA.match(line):
             return True
         
         return False
@@ -363,15 +492,17 @@ class DataExtractor:
     def _extract_with_context(self, lines: List[str]) -> List[Dict[str, Any]]:
         """Extrae partidas usando contexto de líneas adyacentes"""
         items = []
+        last = len(lines) - 1
         
         for i, line in enumerate(lines):
-            line = line.strip()
-            if not line:
+            if not line.strip():
                 continue
             
-            # Considerar contexto de líneas cercanas
-            context_lines = lines[max(0, i-1):i+2]
-            context_text = ' '.join(context_lines)
+            # Considerar contexto de líneas cercanas (ventana de 3 sin recortar la lista)
+            if 0 < i < last:
+                context_text = f"{lines[i-1]} {line} {lines[i+1]}"
+            else:
+                context_text = ' '.join(lines[max(0, i-1):i+2])
             
             item = self._extract_item_with_patterns(context_text)
             if item and self._is_valid_item(item):
@@ -384,50 +515,57 @@ class DataExtractor:
         items = []
         full_text = '\n'.join(lines)
         
-        # Patrones para diferentes formatos de presupuesto
-        budget_patterns = [
-            # Formato complejo con múltiples campos
-            r'(?P<code>\d+(?:\.\d+)*)\s+(?P<desc>.+?)\s+(?P<qty>\d+(?:\.\d+)?)\s*(?P<unit>m2|m3|kg|ml|l|un|m)\s+(?P<uprice>\d+(?:\.\d{2})?)\s+(?P<total>\d+(?:\.\d{2})?)',
-            # Formato con código y cantidad
-            r'(?P<code>[A-Z]{2,3}\d{2,4})\s+(?P<desc>.+?)\s+(?P<qty>\d+(?:\.\d+)?)\s+(?P<unit>m2|m3|kg|ml|l|un|m)',
-            # Formato simple con descripción y precio
-            r'(?P<desc>.+?)\s+(?P<qty>\d+(?:\.\d+)?)\s*(?P<unit>m2|m3|kg|ml|l|un|m)\s+(?P<price>\d+(?:\.\d{2})?)'
-        ]
-        
-        for pattern in budget_patterns:
-            matches = re.finditer(pattern, full_text, re.IGNORECASE | re.MULTILINE)
+        # Se codifica una sola vez y los patrones recorren los bytes; solo se
+        # decodifican los grupos de las partidas encontradas
+        text = full_text.encode('utf-8', 'surrogatepass')
+        coded_re, simple_re = self._RE_BUDGET_ITEM, self._RE_BUDGET_ITEM_SIMPLE
+        
+        # Primero los formatos con código; el formato simple solo se busca en los tramos
+        # que quedan entre ellos, manteniendo el orden del documento
+        matches = []
+        pos = 0
+        for match in coded_re.finditer(text):
+            matches.extend(simple_re.finditer(text, pos, match.start()))
+            matches.append(match)
+            pos = match.end()
+        matches.extend(simple_re.finditer(text, pos))
+        
+        for match in matches:
+            # Quedarse solo con los grupos de la alternativa que casó, sin prefijo
+            branch = match.lastgroup[:2]
+            groups = {
+                name[2:]: value.decode('utf-8', 'surrogatepass')
+                for name, value in match.groupdict().items() if name.startswith(branch) and value is not None
+            }
+            item = {
+                'code': groups.get('code', ''),
+                'description': groups.get('desc', '').strip(),
+                'quantity': Decimal(groups['qty']) if 'qty' in groups and groups['qty'] else None,
+                'unit': groups.get('unit', ''),
+                'unit_price': None,
+                'total_price': None
+            }
             
-            for match in matches:
-                groups = match.groupdict()
-                item = {
-                    'code': groups.get('code', ''),
-                    'description': groups.get('desc', '').strip(),
-                    'quantity': Decimal(groups['qty']) if 'qty' in groups and groups['qty'] else None,
-                    'unit': groups.get('unit', ''),
-                    'unit_price': None,
-                    'total_price': None
-                }
-                
-                # Parsear precios
-                if 'uprice' in groups and groups['uprice']:
-                    try:
-                        item['unit_price'] = Decimal(groups['uprice'])
-                    except:
-                        pass
-                
-                if 'total' in groups and groups['total']:
-                    try:
-                        item['total_price'] = Decimal(groups['total'])
-                    except:
-                        pass
-                elif 'price' in groups and groups['price']:
-                    try:
-                        item['unit_price'] = Decimal(groups['price'])
-                    except:
-                        pass
-                
-                if self._is_valid_item(item):
-                    items.append(item)
+            # Parsear precios
+            if 'uprice' in groups and groups['uprice']:
+                try:
+                    item['unit_price'] = Decimal(groups['uprice'])
+                except:
+                    pass
+            
+            if 'total' in groups and groups['total']:
+                try:
+                    item['total_price'] = Decimal(groups['total'])
+                except:
+                    pass
+            elif 'price' in groups and groups['price']:
+                try:
+                    item['unit_price'] = Decimal(groups['price'])
+                except:
+                    pass
+            
+            if self._is_valid_item(item):
+                items.append(item)
         
         return items
     
@@ -443,31 +581,28 @@ class DataExtractor:
         }
         
         # Buscar código
-        code_match = re.search(r'\b(\d+(?:\.\d+)*)\b', text)
+        code_match = self._RE_CODE_WORD.search(text)
         if code_match:
             item['code'] = code_match.group(1)
         
         # Buscar cantidad
-        qty_match = re.search(r'\b(\d+(?:\.\d+)?)\s*(m2|m3|kg|ml|l|un|m)\b', text, re.IGNORECASE)
+        qty_match = self._RE_QTY_UNIT_WORD.search(text)
         if qty_match:
             item['quantity'] = Decimal(qty_match.group(1))
             item['unit'] = qty_match.group(2)
         
         # Buscar precio
-        for pattern in self.currency_patterns:
-            price_matches = re.findall(pattern, text)
-            if price_matches:
-                try:
-                    clean_price = price_matches[0].replace('$', '').replace(',', '')
-                    item['unit_price'] = Decimal(clean_price)
-                    break
-                except:
-                    pass
+        price_match = self._RE_CURRENCY.search(text)
+        if price_match:
+            cents = _to_cents(price_match.group(0))
+            if cents is not None:
+                item['unit_price'] = _cents_to_decimal(cents)
         
         # Extraer descripción (texto sin números al principio)
-        desc_match = re.search(r'[a-zA-Z].*', text)
+        # El texto llega ya unido en una sola línea, basta con recortar desde la primera letra
+        desc_match = self._RE_ALPHA_START.search(text)
         if desc_match:
-            item['description'] = desc_match.group(0).strip()
+            item['description'] = text[desc_match.start():].strip()
         
         return item if self._is_valid_item(item) else None
     
@@ -477,16 +612,16 @@ class DataExtractor:
         
         for item in items:
             if self._is_valid_item(item):
-                # Limpiar y normalizar
+                # Limpiar y normalizar; los items son intermedios, se modifican en sitio
                 cleaned_item = self._clean_item(item)
                 validated_items.append(cleaned_item)
         
         # Eliminar duplicados basados en código y descripción
         unique_items = []
-        seen_items = set()
+        seen_items: Set[Tuple[str, str]] = set()
         
         for item in validated_items:
-            item_key = f"{item.get('code', '')}_{item.get('description', '')[:50]}"
+            item_key = (item.get('code') or '', (item.get('description') or '')[:50])
             if item_key not in seen_items:
                 seen_items.add(item_key)
                 unique_items.append(item)
@@ -502,33 +637,24 @@ class DataExtractor:
         return has_description and (has_quantity or has_price)
     
     def _clean_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
-        """Limpia y normaliza un item"""
-        cleaned = item.copy()
-        
+        """Limpia y normaliza un item (modifica el propio diccionario)"""
         # Limpiar descripción
-        cleaned['description'] = re.sub(r'\s+', ' ', cleaned.get('description', '')).strip()
+        item['description'] = self._RE_WS.sub(' ', item.get('description', '')).strip()
         
         # Normalizar unidad
-        unit = cleaned.get('unit', '').lower()
-        unit_mapping = {
-            'metros cuadrados': 'm2',
-            'metros cúbicos': 'm3',
-            'kilogramos': 'kg',
-            'litros': 'l',
-            'unidades': 'un',
-            'metros': 'm'
-        }
-        cleaned['unit'] = unit_mapping.get(unit, cleaned.get('unit', ''))
+        unit = item.get('unit', '')
+        unit = self._UNIT_MAPPING.get(unit.lower(), unit)
+        item['unit'] = self._UNIT_INTERN.get(unit, unit)
         
         # Calcular precio total si falta
-        if cleaned.get('quantity') and cleaned.get('unit_price') and not cleaned.get('total_price'):
-            cleaned['total_price'] = cleaned['quantity'] * cleaned['unit_price']
+        if item.get('quantity') and item.get('unit_price') and not item.get('total_price'):
+            item['total_price'] = item['quantity'] * item['unit_price']
         
         # Generar código si falta
-        if not cleaned.get('code'):
-            cleaned['code'] = f"AUTO_{len(cleaned) + 1:03d}"
+        if not item.get('code'):
+            item['code'] = f"AUTO_{len(item) + 1:03d}"
         
-        return cleaned
+        return item
     
     def extract_totals(self, text: str) -> Dict[str, Decimal]:
         """
@@ -541,41 +667,23 @@ class DataExtractor:
             'profit': Decimal('0.00')
         }
         
-        lines = text.upper().split('\n')
-        
-        for line in lines:
-            # Buscar patrones de totales
-            if any(keyword in line for keyword in ['SUBTOTAL', 'SUB-TOTAL', 'SUB TOTAL']):
-                amount = self._extract_amount_from_line(line)
-                if amount:
-                    totals['subtotal'] = amount
-            
-            elif any(keyword in line for keyword in ['IVA', 'TAX', 'IMPUESTO']):
-                amount = self._extract_amount_from_line(line)
-                if amount:
-                    totals['tax'] = amount
-            
-            elif any(keyword in line for keyword in ['TOTAL', 'TOTAL GENERAL']):
-                amount = self._extract_amount_from_line(line)
-                if amount:
-                    totals['total'] = amount
-            
-            elif any(keyword in line for keyword in ['BENEFICIO', 'GANANCIA', 'PROFIT']):
-                amount = self._extract_amount_from_line(line)
-                if amount:
-                    totals['profit'] = amount
+        for line in text.upper().split('\n'):
+            # Buscar patrones de totales; solo el primer campo que coincide extrae importe
+            for field, keywords in self._TOTAL_KEYWORDS:
+                if any(keyword in line for keyword in keywords):
+                    amount = self._extract_amount_from_line(line)
+                    if amount:
+                        totals[field] = amount
+                    break
         
         return totals
     
     def _extract_amount_from_line(self, line: str) -> Optional[Decimal]:
         """Extrae un monto de una línea de texto"""
-        for pattern in self.currency_patterns:
-            matches = re.findall(pattern, line)
-            if matches:
-                try:
-                    clean_amount = matches[-1].replace('$', '').replace(',', '')
-                    return Decimal(clean_amount)
-                except:
-                    continue
+        matches = self._RE_CURRENCY.findall(line)
+        if matches:
+            cents = _to_cents(matches[-1])
+            if cents is not None:
+                return _cents_to_decimal(cents)
         
         return None
\ No newline at end of file
@@ -1,13 +1,48 @@
 import re
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Any, Optional, Tuple
 import logging
 from difflib import SequenceMatcher
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 class FormatDetector:
     """Detecta y clasifica diferentes formatos de presupuestos de construcción"""
     
+    # Expresiones regulares precompiladas (se compilan una sola vez por proceso)
+    _RE_DECIMAL = re.compile(r'\d+\.\d{2}')
+    _RE_THOUSANDS = re.compile(r'\d,\d{3}')
+    _RE_CHAPTER = re.compile(r'CAPÍTULO|CHAPTER')
+    _RE_CURRENCY = re.compile(r'[$€]')
+    _RE_DECIMAL_NUMBER = re.compile(r'\d+\.\d+')
+    _RE_UNIT = re.compile(r'\b(m2|m3|kg|ml|l|un)\b', re.IGNORECASE)
+    _RE_CODE = re.compile(r'\d+(?:\.\d+)+')
+    _RE_PRICES = (
+        re.compile(r'\$?\d+(?:,\d{3})*\.\d{2}'),
+        re.compile(r'\d+(?:\.\d{3})*,\d{2}')
+    )
+    _RE_QUANTITY = re.compile(r'\d+(?:\.\d+)?\s*(?:m2|m3|kg|ml|l|un|m)', re.IGNORECASE)
+    _RE_WIDE_SPACING = re.compile(r'\s{3,}')
+    _RE_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+    
+    # Patrones comunes de items de lista
+    _RE_LIST_ITEMS = (
+        re.compile(r'^\s*\d+(?:\.\d+)*\s+'),  # 1.1.1
+        re.compile(r'^\s*\d+\s*[.-]\s+'),     # 1- o 1.
+        re.compile(r'^\s*[A-Z]{2,3}\d{2,4}\s+')  # AB1234
+    )
+    
+    # Palabras clave de encabezados de tabla y de sección (sobre texto en mayúsculas)
+    _TABLE_HEADER_KEYWORDS = ('ITEM', 'CÓDIGO', 'DESCRIPCIÓN', 'CANTIDAD', 'PRECIO')
+    _SECTION_KEYWORDS = ('CAPÍTULO', 'CHAPTER', 'SECCIÓN', 'SECTION')
+    
+    # Resultados recientes de detect_format indexados por el hash del contenido
+    CACHE_SIZE = 256
+    
     def __init__(self):
         self.known_formats = {
             'standard_table': {
@@ -54,7 +89,17 @@ class FormatDetector:
             }
         }
         
+        # Indicadores de cada formato compilados una vez por instancia
+        self.indicator_patterns = {
+            format_key: [re.compile(indicator, re.IGNORECASE) for indicator in format_info['indicators']]
+            for format_key, format_info in self.known_formats.items()
+        }
+        
         self.format_scores = {}
+        
+        # Caché LRU compartida entre hilos (el detector es único por proceso en la API)
+        self._result_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
     
     def detect_format(self, text: str, ocr_data: Optional[Dict] = None) -> Dict[str, Any]:
         """
@@ -68,21 +113,31 @@ class FormatDetector:
             Dict con información del formato detectado
         """
         try:
+            # El análisis solo depende del texto y de las palabras de OCR
+            cache_key = self._get_cache_key(text, ocr_data)
+            with self._cache_lock:
+                cached = self._result_cache.get(cache_key)
+                if cached is not None:
+                    self._result_cache.move_to_end(cache_key)
+            if cached is not None:
+                logger.debug(f"Formato recuperado de caché: {cached['format_name']}")
+                return copy.deepcopy(cached)
+            
             # Limpiar texto
             clean_text = text.upper()
             lines = clean_text.split('\n')
             
             # Analizar diferentes aspectos
-            structure_analysis = self._analyze_structure(lines)
+            structure_analysis, pattern_analysis = self._analyze_lines(lines)
             content_analysis = self._analyze_content(clean_text)
-            pattern_analysis = self._analyze_patterns(lines)
             
             # Calcular puntuaciones para cada formato conocido
             format_scores = {}
             
             for format_key, format_info in self.known_formats.items():
                 score = self._calculate_format_score(
-                    format_info, structure_analysis, content_analysis, pattern_analysis
+                    format_info, self.indicator_patterns[format_key],
+                    structure_analysis, content_analysis, pattern_analysis
                 )
                 format_scores[format_key] = score
             
@@ -107,6 +162,13 @@ class FormatDetector:
             }
             
             logger.info(f"Formato detectado: {result['format_name']} (confianza: {result['confidence']:.2f})")
+            
+            # Se guarda una copia para que el llamador pueda modificar el resultado
+            with self._cache_lock:
+                self._result_cache[cache_key] = copy.deepcopy(result)
+                if len(self._result_cache) > self.CACHE_SIZE:
+                    self._result_cache.popitem(last=False)
+            
             return result
             
         except Exception as e:
@@ -118,111 +180,121 @@ class FormatDetector:
                 'error': str(e)
             }
     
-    def _analyze_structure(self, lines: List[str]) -> Dict[str, Any]:
-        """Analiza la estructura del documento"""
-        analysis = {
-            'total_lines': len(lines),
-            'empty_lines': sum(1 for line in lines if not line.strip()),
-            'header_lines': 0,
-            'table_lines': 0,
-            'list_items': 0,
-            'section_headers': 0,
-            'has_table_structure': False,
-            'has_list_structure': False,
-            'average_line_length': 0
-        }
+    def _get_cache_key(self, text: str, ocr_data: Optional[Dict]) -> bytes:
+        """Calcula la clave de caché a partir del texto y, si hay OCR, de sus palabras"""
+        digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16)
+        if ocr_data:
+            digest.update(b'\0' + repr(ocr_data.get('words')).encode('utf-8', 'surrogatepass'))
+        return digest.digest()
+    
+    def _analyze_lines(self, lines: List[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Analiza la estructura y los patrones del documento en un único recorrido
         
-        if lines:
-            analysis['average_line_length'] = sum(len(line) for line in lines) / len(lines)
+        Args:
+            lines: Líneas del texto ya convertido a mayúsculas
+            
+        Returns:
+            Tupla (análisis de estructura, análisis de patrones)
+        """
+        total_lines = len(lines)
+        non_empty_lines = 0
+        header_lines = table_lines = list_items = section_headers = 0
+        code_patterns = price_patterns = quantity_patterns = tab_separated = 0
+        
+        search_code = self._RE_CODE.search
+        search_quantity = self._RE_QUANTITY.search
+        search_wide_spacing = self._RE_WIDE_SPACING.search
+        find_numbers = self._RE_NUMBER.findall
+        price_res = self._RE_PRICES
+        list_item_res = self._RE_LIST_ITEMS
         
-        # Analizar tipos de líneas
         for line in lines:
             line = line.strip()
             if not line:
                 continue
+            non_empty_lines += 1
             
             # Detectar encabezados de tabla
-            if any(indicator in line.upper() for indicator in ['ITEM', 'CÓDIGO', 'DESCRIPCIÓN', 'CANTIDAD', 'PRECIO']):
-                analysis['header_lines'] += 1
+            if any(indicator in line for indicator in self._TABLE_HEADER_KEYWORDS):
+                header_lines += 1
             
             # Detectar líneas de tabla (múltiples columnas de números)
-            if self._is_table_line(line):
-                analysis['table_lines'] += 1
+            if len(line.split()) >= 4 and len(find_numbers(line)) >= 2:
+                table_lines += 1
             
             # Detectar items de lista
-            if self._is_list_item(line):
-                analysis['list_items'] += 1
+            if any(pattern.match(line) for pattern in list_item_res):
+                list_items += 1
             
-            # Detectar encabezados de sección
-            if self._is_section_header(line):
-                analysis['section_headers'] += 1
-        
-        # Determinar estructura predominante
-        analysis['has_table_structure'] = analysis['table_lines'] > len(lines) * 0.3
-        analysis['has_list_structure'] = analysis['list_items'] > len(lines) * 0.4
-        
-        return analysis
-    
-    def _analyze_content(self, text: str) -> Dict[str, Any]:
-        """Analiza el contenido del texto"""
-        analysis = {
-            'has_currency_symbols': '$' in text or '€' in text,
-            'has_decimal_numbers': len(re.findall(r'\d+\.\d{2}', text)) > 0,
-            'has_thousand_separators': len(re.findall(r'\d,\d{3}', text)) > 0,
-            'has_units': any(unit in text.lower() for unit in ['m2', 'm3', 'kg', 'ml', 'l', 'un']),
-            'has_chapter_headers': len(re.findall(r'CAPÍTULO|CHAPTER', text)) > 0,
-            'has_totals': any(word in text for word in ['TOTAL', 'SUBTOTAL', 'SUB-TOTAL']),
-            'has_breakdown': any(word in text for word in ['MATERIALES', 'MANO DE OBRA', 'EQUIPO']),
-            'currency_count': len(re.findall(r'[$€]', text)),
-            'number_count': len(re.findall(r'\d+\.\d+', text)),
-            'unit_count': len(re.findall(r'\b(m2|m3|kg|ml|l|un)\b', text, re.IGNORECASE))
-        }
-        
-        return analysis
-    
-    def _analyze_patterns(self, lines: List[str]) -> Dict[str, Any]:
-        """Analiza patrones en las líneas"""
-        patterns = {
-            'repeated_patterns': 0,
-            'code_patterns': 0,
-            'price_patterns': 0,
-            'quantity_patterns': 0,
-            'consistent_spacing': 0,
-            'tab_separated': 0
-        }
-        
-        # Analizar patrones en cada línea
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
+            # Detectar encabezados de sección: cortos y en mayúsculas o con palabras clave
+            if len(line) < 50 and (line.isupper() or any(keyword in line for keyword in self._SECTION_KEYWORDS)):
+                section_headers += 1
             
             # Contar patrones de códigos
-            if re.search(r'\d+(?:\.\d+)+', line):
-                patterns['code_patterns'] += 1
+            if search_code(line):
+                code_patterns += 1
             
             # Contar patrones de precios
-            if any(re.search(p, line) for p in [r'\$?\d+(?:,\d{3})*\.\d{2}', r'\d+(?:\.\d{3})*,\d{2}']):
-                patterns['price_patterns'] += 1
+            if any(pattern.search(line) for pattern in price_res):
+                price_patterns += 1
             
             # Contar patrones de cantidades con unidades
-            if re.search(r'\d+(?:\.\d+)?\s*(?:m2|m3|kg|ml|l|un|m)', line, re.IGNORECASE):
-                patterns['quantity_patterns'] += 1
+            if search_quantity(line):
+                quantity_patterns += 1
             
             # Detectar separación por tabulaciones o múltiples espacios
-            if '\t' in line or re.search(r'\s{3,}', line):
-                patterns['tab_separated'] += 1
+            if '\t' in line or search_wide_spacing(line):
+                tab_separated += 1
+        
+        structure = {
+            'total_lines': total_lines,
+            'empty_lines': total_lines - non_empty_lines,
+            'header_lines': header_lines,
+            'table_lines': table_lines,
+            'list_items': list_items,
+            'section_headers': section_headers,
+            # Determinar estructura predominante
+            'has_table_structure': table_lines > total_lines * 0.3,
+            'has_list_structure': list_items > total_lines * 0.4,
+            'average_line_length': sum(map(len, lines)) / total_lines if lines else 0
+        }
+        
+        patterns = {
+            'repeated_patterns': 0,
+            'code_patterns': code_patterns,
+            'price_patterns': price_patterns,
+            'quantity_patterns': quantity_patterns,
+            'consistent_spacing': 0,
+            'tab_separated': tab_separated
+        }
         
         # Analizar consistencia de patrones
-        total_lines = len([l for l in lines if l.strip()])
-        if total_lines > 0:
+        if non_empty_lines > 0:
             patterns['repeated_patterns'] = (
-                patterns['code_patterns'] / total_lines +
-                patterns['price_patterns'] / total_lines +
-                patterns['quantity_patterns'] / total_lines
+                code_patterns / non_empty_lines +
+                price_patterns / non_empty_lines +
+                quantity_patterns / non_empty_lines
             ) / 3
         
-        return patterns
+        return structure, patterns
+    
+    def _analyze_content(self, text: str) -> Dict[str, Any]:
+        """Analiza el contenido del texto"""
+        analysis = {
+            'has_currency_symbols': '$' in text or '€' in text,
+            'has_decimal_numbers': self._RE_DECIMAL.search(text) is not None,
+            'has_thousand_separators': self._RE_THOUSANDS.search(text) is not None,
+            'has_units': any(unit in text.lower() for unit in ['m2', 'm3', 'kg', 'ml', 'l', 'un']),
+            'has_chapter_headers': self._RE_CHAPTER.search(text) is not None,
+            'has_totals': any(word in text for word in ['TOTAL', 'SUBTOTAL', 'SUB-TOTAL']),
+            'has_breakdown': any(word in text for word in ['MATERIALES', 'MANO DE OBRA', 'EQUIPO']),
+            'currency_count': len(self._RE_CURRENCY.findall(text)),
+            'number_count': len(self._RE_DECIMAL_NUMBER.findall(text)),
+            'unit_count': len(self._RE_UNIT.findall(text))
+        }
+        
+        return analysis
     
     def _analyze_layout(self, ocr_data: Dict[str, Any]) -> Dict[str, Any]:
         """Analiza el layout usando datos de OCR"""
@@ -233,125 +305,89 @@ class FormatDetector:
         if not words:
             return {}
         
-        # Analizar distribución espacial
-        x_coords = [w['x'] for w in words]
-        y_coords = [w['y'] for w in words]
+        # Analizar distribución espacial: coordenadas como arreglos, una sola extracción
+        count = len(words)
+        y_values = [w['y'] for w in words]
+        x_coords = np.fromiter((w['x'] for w in words), dtype=np.float64, count=count)
+        y_coords = np.array(y_values, dtype=np.float64)
         
         analysis = {
-            'has_aligned_columns': self._detect_columns(x_coords, y_coords),
-            'has_grid_structure': self._detect_grid_structure(words),
-            'text_density': len(words) / (max(y_coords) - min(y_coords)) if y_coords else 0,
-            'average_word_spacing': self._calculate_average_spacing(words),
-            'alignment_consistency': self._analyze_alignment(words)
+            'has_aligned_columns': self._detect_columns(x_coords),
+            'has_grid_structure': self._detect_grid_structure(x_coords, y_coords),
+            'text_density': count / (max(y_values) - min(y_values)),
+            'average_word_spacing': self._calculate_average_spacing(words, x_coords, y_coords),
+            'alignment_consistency': self._analyze_alignment(x_coords, y_coords)
         }
         
         return analysis
     
-    def _detect_columns(self, x_coords: List[int], y_coords: List[int]) -> bool:
+    def _detect_columns(self, x_coords: np.ndarray) -> bool:
         """Detecta si el texto está organizado en columnas"""
-        if not x_coords:
+        if not len(x_coords):
             return False
         
-        # Buscar agrupaciones en las coordenadas X
-        x_coords_sorted = sorted(x_coords)
-        gaps = []
-        
-        for i in range(1, len(x_coords_sorted)):
-            gap = x_coords_sorted[i] - x_coords_sorted[i-1]
-            if gap > 50:  # Gap significativo
-                gaps.append(gap)
-        
-        # Si hay suficientes gaps grandes, probablemente hay columnas
-        return len(gaps) > 3
+        # Buscar agrupaciones en las coordenadas X: si hay suficientes gaps
+        # significativos (> 50), probablemente hay columnas
+        gaps = np.diff(np.sort(x_coords))
+        return int(np.count_nonzero(gaps > 50)) > 3
     
-    def _detect_grid_structure(self, words: List[Dict]) -> bool:
-        """Detecta si hay estructura de grill"""
-        if len(words) < 10:
+    def _detect_grid_structure(self, x_coords: np.ndarray, y_coords: np.ndarray) -> bool:
+        """Detecta si hay estructura de grilla"""
+        count = len(x_coords)
+        if count < 10:
             return False
         
-        # Verificar alineación en filas y columnas
-        y_positions = set(round(w['y'] / 10) for w in words)  # Agrupar por filas
-        x_positions = set(round(w['x'] / 10) for w in words)  # Agrupar por columnas
+        # Verificar alineación en filas y columnas (agrupando de a 10 unidades)
+        y_positions = np.unique(np.round(y_coords / 10)).size
+        x_positions = np.unique(np.round(x_coords / 10)).size
         
         # Si hay muchas posiciones Y similares y X similares, puede ser una grilla
-        return len(y_positions) < len(words) * 0.3 and len(x_positions) < len(words) * 0.3
+        return y_positions < count * 0.3 and x_positions < count * 0.3
     
-    def _calculate_average_spacing(self, words: List[Dict]) -> float:
+    def _calculate_average_spacing(self, words: List[Dict], x_coords: np.ndarray, y_coords: np.ndarray) -> float:
         """Calcula el espaciado promedio entre palabras"""
         if len(words) < 2:
             return 0.0
         
-        spacings = []
-        words_sorted = sorted(words, key=lambda w: (w['y'], w['x']))
+        # Ordenar por (y, x); lexsort es estable como sorted()
+        order = np.lexsort((x_coords, y_coords))
+        widths = np.fromiter((w['width'] for w in words), dtype=np.float64, count=len(words))[order]
+        xs = x_coords[order]
         
-        for i in range(1, len(words_sorted)):
-            if abs(words_sorted[i]['y'] - words_sorted[i-1]['y']) < 20:  # Misma línea
-                spacing = words_sorted[i]['x'] - (words_sorted[i-1]['x'] + words_sorted[i-1]['width'])
-                spacings.append(spacing)
+        # Solo cuentan los pares de palabras consecutivas en la misma línea
+        same_line = np.abs(np.diff(y_coords[order])) < 20
+        spacings = (xs[1:] - (xs[:-1] + widths[:-1]))[same_line]
         
-        return sum(spacings) / len(spacings) if spacings else 0.0
+        return float(spacings.mean()) if spacings.size else 0.0
     
-    def _analyze_alignment(self, words: List[Dict]) -> float:
+    def _analyze_alignment(self, x_coords: np.ndarray, y_coords: np.ndarray) -> float:
         """Analiza la consistencia del alineamiento"""
-        if len(words) < 2:
+        if len(x_coords) < 2:
             return 0.0
         
-        # Agrupar palabras por líneas
-        lines = {}
-        for word in words:
-            line_key = round(word['y'] / 15)  # Agrupar por líneas aproximadas
-            if line_key not in lines:
-                lines[line_key] = []
-            lines[line_key].append(word)
-        
-        # Calcular consistencia de alineamiento
-        consistencies = []
-        for line_words in lines.values():
-            if len(line_words) > 1:
-                x_coords = [w['x'] for w in line_words]
-                consistency = 1.0 - (max(x_coords) - min(x_coords)) / 1000
-                consistencies.append(max(0.0, consistency))
-        
-        return sum(consistencies) / len(consistencies) if consistencies else 0.0
-    
-    def _is_table_line(self, line: str) -> bool:
-        """Determina si una línea parece ser parte de una tabla"""
-        # Contar números y palabras
-        numbers = re.findall(r'\d+(?:\.\d+)?', line)
-        words = line.split()
-        
-        # Una línea de tabla típicamente tiene números y múltiples palabras
-        return len(numbers) >= 2 and len(words) >= 4
-    
-    def _is_list_item(self, line: str) -> bool:
-        """Determina si una línea parece ser un item de lista"""
-        # Patrones comunes de items de lista
-        patterns = [
-            r'^\s*\d+(?:\.\d+)*\s+',  # 1.1.1
-            r'^\s*\d+\s*[.-]\s+',     # 1- o 1.
-            r'^\s*[A-Z]{2,3}\d{2,4}\s+'  # AB1234
-        ]
-        
-        return any(re.match(pattern, line) for pattern in patterns)
-    
-    def _is_section_header(self, line: str) -> bool:
-        """Determina si una línea parece ser un encabezado de sección"""
-        line = line.strip()
+        # Agrupar palabras por líneas aproximadas (de a 15 unidades)
+        line_keys = np.round(y_coords / 15)
+        order = np.argsort(line_keys, kind='stable')
+        sorted_keys = line_keys[order]
+        sorted_x = x_coords[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(sorted_keys)])
         
-        # Es corta, está en mayúsculas, o contiene palabras clave
-        is_short = len(line) < 50
-        is_uppercase = line.isupper()
-        has_keywords = any(keyword in line for keyword in ['CAPÍTULO', 'CHAPTER', 'SECCIÓN', 'SECTION'])
+        # Consistencia por línea con más de una palabra: 1 - ancho ocupado / 1000, mínimo 0
+        spans = np.maximum.reduceat(sorted_x, starts) - np.minimum.reduceat(sorted_x, starts)
+        consistencies = np.maximum(0.0, 1.0 - spans[sizes > 1] / 1000)
         
-        return is_short and (is_uppercase or has_keywords)
+        return float(consistencies.mean()) if consistencies.size else 0.0
     
-    def _calculate_format_score(self, format_info: Dict, structure: Dict, content: Dict, patterns: Dict) -> float:
+    def _calculate_format_score(self, format_info: Dict, indicator_patterns: List[re.Pattern],
+                                structure: Dict, content: Dict, patterns: Dict) -> float:
         """Calcula la puntuación de coincidencia para un formato"""
         score = 0.0
         
-        # Puntuación basada en indicadores
-        for indicator in format_info.get('indicators', []):
-            if re.search(indicator, str(structure) + str(content), re.IGNORECASE):
+        # Puntuación basada en indicadores (el texto del análisis se arma una sola vez)
+        analysis_text = str(structure) + str(content)
+        for pattern in indicator_patterns:
+            if pattern.search(analysis_text):
                 score += 1.0
         
         # Normalizar por número de indicadores
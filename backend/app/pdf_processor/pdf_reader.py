@@ -1,24 +1,76 @@
 import fitz  # PyMuPDF
 import os
+import hashlib
+import json
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _extract_pages_text(data: bytes, start: int, stop: int, flags: int) -> List[str]:
+    """
+    Extrae el texto de un rango de páginas. Se ejecuta en un proceso de trabajo,
+    por lo que abre su propio documento (fitz no se comparte entre procesos) a
+    partir de los bytes ya leídos, sin volver al disco
+    """
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        return [doc.get_page_text(page_num, flags=flags) for page_num in range(start, stop)]
+
+def _render_pages(file_path: str, page_numbers: List[int], output_paths: List[str], dpi: int) -> None:
+    """Renderiza y guarda varias páginas abriendo el documento una sola vez"""
+    zoom = dpi / 72  # 72 es el DPI por defecto de PDF
+    mat = fitz.Matrix(zoom, zoom)
+    
+    with fitz.open(file_path) as doc:
+        for page_number, output_path in zip(page_numbers, output_paths):
+            pix = doc.load_page(page_number).get_pixmap(matrix=mat, alpha=False)
+            pix.save(output_path)
+            del pix
+
 class PDFReader:
     """Clase principal para leer y procesar archivos PDF"""
     
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
         self.supported_formats = ['.pdf']
         self.max_file_size = 50 * 1024 * 1024  # 50MB
+        self.max_workers = min(os.cpu_count() or 1, 4)
+        self.parallel_min_pages = 20  # Por debajo no compensa arrancar procesos
+        self.scan_sample_pages = 3  # Páginas de muestra para la detección temprana de escaneados
+        
+        # Flags de extracción de MuPDF: los valores por defecto sin ligaduras (se expanden
+        # a letras normales) y, en modo dict, sin los bloques de imagen que no se usan
+        self.text_flags = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+        self.dict_flags = fitz.TEXTFLAGS_DICT & ~(fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_IMAGES)
+        
+        # Pool de procesos compartido, creado al primer uso. Se arranca con 'spawn': la API
+        # llama a read_pdf desde hilos del threadpool, y hacer fork de un proceso con varios
+        # hilos puede dejar a los hijos bloqueados en locks ajenos (logging, MuPDF)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        
+        # Caché en disco de resultados, indexada por el hash del contenido
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
     
-    def read_pdf(self, file_path: str) -> Dict[str, Any]:
+    def read_pdf(self, file_path: str, num_workers: Optional[int] = None, include_pages: bool = True,
+                 force_refresh: bool = False, early_exit_on_scanned: bool = False) -> Dict[str, Any]:
         """
         Lee un archivo PDF y extrae su contenido
         
         Args:
             file_path: Ruta al archivo PDF
+            num_workers: Procesos para extraer texto en paralelo (por defecto y como máximo max_workers)
+            include_pages: Si es False no se construye el detalle por página ('pages' queda vacío)
+            force_refresh: Ignora la caché y vuelve a procesar el archivo
+            early_exit_on_scanned: Si las primeras páginas parecen escaneadas, devuelve solo
+                esas páginas sin extraer el resto (el llamador pasará a OCR)
             
         Returns:
             Dict con texto, metadata y información del documento
@@ -32,28 +84,56 @@ class PDFReader:
             if file_size > self.max_file_size:
                 raise ValueError(f"Archivo demasiado grande: {file_size} bytes")
             
-            # Abrir PDF
-            doc = fitz.open(file_path)
+            # Leer el archivo una sola vez; los mismos bytes sirven para el hash y para fitz
+            with open(file_path, 'rb') as f:
+                data = f.read()
             
-            # Extraer información básica
-            info = self._extract_pdf_info(doc)
+            # Reutilizar el resultado si ya se procesó un archivo con el mismo contenido
+            cache_path = self._get_cache_path(data, include_pages)
+            if cache_path is not None and not force_refresh and cache_path.exists():
+                cached = json.loads(cache_path.read_text(encoding='utf-8'))
+                logger.info(f"PDF leído desde caché: {file_path}")
+                return {'file_path': file_path, 'file_name': os.path.basename(file_path), **cached}
             
-            # Extraer texto de cada página
+            # Abrir PDF (el bloque with cierra el documento aunque falle la extracción)
+            with fitz.open(stream=data, filetype='pdf') as doc:
+                # Extraer información básica
+                info = self._extract_pdf_info(doc)
+                
+                # Extraer texto de cada página, repartiendo las páginas entre procesos en documentos grandes
+                total_pages = len(doc)
+                
+                # Muestrear las primeras páginas para cortar pronto en documentos escaneados
+                sampled = []
+                if early_exit_on_scanned:
+                    sample_size = min(self.scan_sample_pages, total_pages)
+                    sampled = [doc.get_page_text(page_num, flags=self.text_flags) for page_num in range(sample_size)]
+                
+                workers = min(num_workers or self.max_workers, self.max_workers, total_pages)
+                if early_exit_on_scanned and self._detect_scanned_pdf(sum(len(text) for text in sampled), len(sampled)):
+                    texts = sampled
+                elif workers > 1 and total_pages >= self.parallel_min_pages:
+                    texts = self._extract_texts_parallel(data, total_pages, workers)
+                else:
+                    texts = sampled + [
+                        doc.get_page_text(page_num, flags=self.text_flags) for page_num in range(len(sampled), total_pages)
+                    ]
+            
+            # Detalle por página y longitud total en una sola pasada
             pages_text = []
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text()
-                pages_text.append({
-                    'page_number': page_num + 1,
-                    'text': text,
-                    'text_length': len(text)
-                })
+            total_text_length = 0
+            for page_num, text in enumerate(texts):
+                text_length = len(text)
+                total_text_length += text_length
+                if include_pages:
+                    pages_text.append({
+                        'page_number': page_num + 1,
+                        'text': text,
+                        'text_length': text_length
+                    })
             
             # Detectar si es un PDF escaneado (poca o ninguna texto extraíble)
-            is_scanned = self._detect_scanned_pdf(pages_text)
-            
-            # Cerrar documento
-            doc.close()
+            is_scanned = self._detect_scanned_pdf(total_text_length, total_pages)
             
             result = {
                 'file_path': file_path,
@@ -61,12 +141,16 @@ class PDFReader:
                 'file_size': file_size,
                 'metadata': info,
                 'pages': pages_text,
-                'total_pages': len(pages_text),
+                'total_pages': total_pages,
                 'is_scanned': is_scanned,
-                'extracted_text': '\n'.join([page['text'] for page in pages_text]),
+                'extracted_text': '\n'.join(texts),
                 'processing_time': 0.0  # Se llenará en el servicio principal
             }
             
+            # Un resultado cortado tras el muestreo no se guarda: no contiene todas las páginas
+            if cache_path is not None and len(texts) == total_pages:
+                self._save_to_cache(cache_path, result)
+            
             logger.info(f"PDF leído exitosamente: {file_path}")
             return result
             
@@ -74,6 +158,67 @@ class PDFReader:
             logger.error(f"Error leyendo PDF {file_path}: {str(e)}")
             raise
     
+    def _get_cache_path(self, data: bytes, include_pages: bool) -> Optional[Path]:
+        """Calcula la ruta en caché a partir del SHA-1 del contenido del archivo"""
+        if self.cache_dir is None:
+            return None
+        
+        variant = 'pages' if include_pages else 'text'
+        return self.cache_dir / f"{hashlib.sha1(data).hexdigest()}_{variant}.json"
+    
+    def _save_to_cache(self, cache_path: Path, result: Dict[str, Any]) -> None:
+        """Guarda el resultado (sin la ruta del archivo) de forma atómica"""
+        cached = {key: value for key, value in result.items() if key not in ('file_path', 'file_name')}
+        
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cached, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la caché de {cache_path.name}: {str(e)}")
+    
+    def _extract_texts_parallel(self, data: bytes, total_pages: int, workers: int) -> List[str]:
+        """Extrae el texto de todas las páginas en bloques contiguos, uno por proceso"""
+        chunk_size = -(-total_pages // workers)
+        starts = list(range(0, total_pages, chunk_size))
+        stops = [min(start + chunk_size, total_pages) for start in starts]
+        
+        chunks = self._map_in_pool(
+            _extract_pages_text, [data] * len(starts), starts, stops, [self.text_flags] * len(starts)
+        )
+        return [text for chunk in chunks for text in chunk]
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Devuelve el pool de procesos compartido, creándolo en el primer uso"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+    
+    def _map_in_pool(self, fn, *iterables) -> List[Any]:
+        """Ejecuta fn en el pool compartido y devuelve los resultados en orden"""
+        executor = self._get_executor()
+        try:
+            # list() propaga aquí los errores de los procesos de trabajo
+            return list(executor.map(fn, *iterables))
+        except BrokenProcessPool:
+            # Un proceso murió: descartar el pool para que la siguiente llamada cree otro
+            with self._executor_lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+    
+    def close(self) -> None:
+        """Detiene el pool de procesos compartido, si llegó a crearse"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+    
     def _extract_pdf_info(self, doc: fitz.Document) -> Dict[str, Any]:
         """Extrae metadata del PDF"""
         metadata = doc.metadata
@@ -96,16 +241,15 @@ class PDFReader:
         
         return info
     
-    def _detect_scanned_pdf(self, pages_text: List[Dict]) -> bool:
+    def _detect_scanned_pdf(self, total_text_length: int, total_pages: int) -> bool:
         """
         Detecta si un PDF está escaneado basándose en la cantidad de texto
         """
-        if not pages_text:
+        if not total_pages:
             return True
         
         # Calcular estadísticas de texto
-        total_text_length = sum(page['text_length'] for page in pages_text)
-        avg_text_length = total_text_length / len(pages_text)
+        avg_text_length = total_text_length / total_pages
         
         # Si el promedio de caracteres por página es muy bajo, probablemente es escaneado
         return avg_text_length < 100
@@ -117,59 +261,41 @@ class PDFReader:
         tables = []
         
         # Buscar áreas que parezcan tablas basándose en la disposición del texto
-        text_dict = page.get_text("dict")
+        text_dict = page.get_text("dict", flags=self.dict_flags)
         
         if not text_dict or "blocks" not in text_dict:
             return tables
         
         # Agrupar texto por líneas horizontales (misma coordenada Y)
-        lines_dict = {}
+        lines_dict: Dict[float, List[str]] = {}
         
         for block in text_dict["blocks"]:
-            if "lines" not in block:
-                continue
-                
-            for line in block["lines"]:
+            for line in block.get("lines", ()):
                 y_coord = round(line["bbox"][1], 1)  # Coordenada Y redondeada
-                
-                if y_coord not in lines_dict:
-                    lines_dict[y_coord] = []
-                
-                line_text = ""
-                for span in line["spans"]:
-                    line_text += span["text"] + " "
-                
-                lines_dict[y_coord].append(line_text.strip())
+                line_text = ' '.join(span["text"] for span in line["spans"]).strip()
+                if not line_text:
+                    continue  # Líneas solo con espacios no aportan filas
+                lines_dict.setdefault(y_coord, []).append(line_text)
         
         # Buscar patrones de tabla (líneas con estructura similar)
         if len(lines_dict) > 2:  # Mínimo 3 líneas para considerar una tabla
-            y_coords = sorted(lines_dict.keys())
-            
-            # Buscar grupos de líneas con espaciado consistente
-            table_lines = []
+            # Un único barrido por Y: cada salto grande cierra el grupo en curso
+            table_rows: List[List[str]] = []
             prev_y = None
             
-            for y in y_coords:
-                if prev_y is None or (y - prev_y) < 50:  # Espaciado máximo entre filas
-                    table_lines.append(y)
-                else:
+            for y in sorted(lines_dict):
+                if prev_y is not None and (y - prev_y) >= 50:  # Espaciado máximo entre filas
                     # Si tenemos suficientes líneas, considerarlo una tabla
-                    if len(table_lines) >= 3:
-                        table_data = []
-                        for line_y in table_lines:
-                            table_data.append(lines_dict[line_y])
-                        tables.append(table_data)
-                    
-                    table_lines = [y]
+                    if len(table_rows) >= 3:
+                        tables.append(table_rows)
+                    table_rows = []
                 
+                table_rows.append(lines_dict[y])
                 prev_y = y
             
             # No olvidar el último grupo
-            if len(table_lines) >= 3:
-                table_data = []
-                for line_y in table_lines:
-                    table_data.append(lines_dict[line_y])
-                tables.append(table_data)
+            if len(table_rows) >= 3:
+                tables.append(table_rows)
         
         return tables
     
@@ -178,31 +304,32 @@ class PDFReader:
         Extrae información de imágenes de una página específica
         """
         try:
-            doc = fitz.open(file_path)
-            page = doc.load_page(page_number)
-            
-            images = []
-            image_list = page.get_images()
-            
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                pix = fitz.Pixmap(doc, xref)
+            with fitz.open(file_path) as doc:
+                page = doc.load_page(page_number)
                 
-                if pix.n - pix.alpha < 4:  # GRAY or RGB
-                    image_info = {
-                        'index': img_index,
-                        'xref': xref,
-                        'width': pix.width,
-                        'height': pix.height,
-                        'colorspace': pix.colorspace,
-                        'size': len(pix.tobytes()),
-                        'is_scanned': pix.width > 800 and pix.height > 1000  # Aproximado para documentos
-                    }
-                    images.append(image_info)
+                images = []
+                image_list = page.get_images()
                 
-                pix = None
+                for img_index, img in enumerate(image_list):
+                    xref = img[0]
+                    pix = fitz.Pixmap(doc, xref)
+                    
+                    if pix.n - pix.alpha < 4:  # GRAY or RGB
+                        image_info = {
+                            'index': img_index,
+                            'xref': xref,
+                            'width': pix.width,
+                            'height': pix.height,
+                            'colorspace': pix.colorspace,
+                            # Tamaño de los píxeles en memoria, sin codificar la imagen a PNG para medirla
+                            'size': len(pix.samples_mv),
+                            'is_scanned': pix.width > 800 and pix.height > 1000  # Aproximado para documentos
+                        }
+                        images.append(image_info)
+                    
+                    # Liberar el pixmap antes de decodificar la siguiente imagen
+                    del pix
             
-            doc.close()
             return images
             
         except Exception as e:
@@ -214,20 +341,55 @@ class PDFReader:
         Convierte una página PDF en imagen para procesamiento OCR
         """
         try:
-            doc = fitz.open(file_path)
-            page = doc.load_page(page_number)
-            
-            # Convertir a imagen con alta resolución
-            zoom = dpi / 72  # 72 es el DPI por defecto de PDF
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
-            
-            # Guardar imagen
-            pix.save(output_path)
+            with fitz.open(file_path) as doc:
+                page = doc.load_page(page_number)
+                
+                # Convertir a imagen con alta resolución
+                zoom = dpi / 72  # 72 es el DPI por defecto de PDF
+                mat = fitz.Matrix(zoom, zoom)
+                pix = page.get_pixmap(matrix=mat)
+                
+                # Guardar imagen
+                pix.save(output_path)
+                del pix
             
-            doc.close()
             return True
             
         except Exception as e:
             logger.error(f"Error guardando página como imagen: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def save_pages_as_images(self, file_path: str, page_numbers: List[int], output_dir: str,
+                             dpi: int = 300, num_workers: Optional[int] = None) -> List[str]:
+        """
+        Convierte varias páginas PDF en imágenes para procesamiento OCR, sin reabrir
+        el documento por página (en documentos grandes, una apertura por proceso)
+        
+        Returns:
+            Rutas de las imágenes generadas, en el orden de page_numbers
+        """
+        try:
+            output_dir = Path(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            output_paths = [str(output_dir / f"page_{page_number + 1}.png") for page_number in page_numbers]
+            
+            workers = min(num_workers or self.max_workers, self.max_workers, len(page_numbers))
+            if workers > 1 and len(page_numbers) >= self.parallel_min_pages:
+                chunk_size = -(-len(page_numbers) // workers)
+                starts = range(0, len(page_numbers), chunk_size)
+                
+                self._map_in_pool(
+                    _render_pages,
+                    [file_path] * len(starts),
+                    [page_numbers[start:start + chunk_size] for start in starts],
+                    [output_paths[start:start + chunk_size] for start in starts],
+                    [dpi] * len(starts)
+                )
+            else:
+                _render_pages(file_path, page_numbers, output_paths, dpi)
+            
+            return output_paths
+            
+        except Exception as e:
+            logger.error(f"Error guardando páginas como imágenes: {str(e)}")
+            return []
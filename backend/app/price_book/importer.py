@@ -5,6 +5,7 @@ import logging
 from pathlib import Path
 from decimal import Decimal
 from datetime import datetime
+import csv
 import io
 
 logger = logging.getLogger(__name__)
@@ -12,6 +13,13 @@ logger = logging.getLogger(__name__)
 class PriceBookImporter:
     """Importa libros de precios desde archivos Excel o CSV"""
     
+    # Textos que se consideran celdas vacías tras limpiar espacios
+    _EMPTY_VALUES = ['', 'nan', 'NaN', 'None']
+    # Columnas que se convierten a número
+    _NUMERIC_COLUMNS = [
+        'unit_price', 'labor_percentage', 'material_percentage', 'equipment_percentage', 'performance_rate'
+    ]
+    
     def __init__(self):
         self.supported_formats = ['.xlsx', '.xls', '.csv']
         self.required_columns = ['code', 'description', 'unit', 'unit_price']
@@ -33,6 +41,12 @@ class PriceBookImporter:
             'performance_rate': ['performance', 'rendimiento', 'performance_rate', 'output_rate'],
             'notes': ['notes', 'notas', 'comments', 'comentarios', 'observations', 'observaciones']
         }
+        
+        # Alias ya en minúsculas para no recalcularlos en cada importación
+        self._lowered_mappings = {
+            standard_col: [name.lower() for name in possible_names]
+            for standard_col, possible_names in self.column_mappings.items()
+        }
     
     def import_from_file(self, file_path: str, price_book_id: int, 
                         mapping_overrides: Optional[Dict] = None,
@@ -138,19 +152,7 @@ class PriceBookImporter:
             if suffix in ['.xlsx', '.xls']:
                 df = pd.read_excel(io.BytesIO(file_content))
             elif suffix == '.csv':
-                # Intentar diferentes encodings
-                encodings = ['utf-8', 'latin-1', 'cp1252']
-                df = None
-                
-                for encoding in encodings:
-                    try:
-                        df = pd.read_csv(io.StringIO(file_content.decode(encoding)))
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if df is None:
-                    raise ValueError("No se pudo decodificar el archivo CSV")
+                df = pd.read_csv(io.StringIO(self._decode_csv(file_content)))
             else:
                 raise ValueError(f"Formato no soportado: {suffix}")
             
@@ -198,23 +200,28 @@ class PriceBookImporter:
         suffix = file_path.suffix.lower()
         
         if suffix == '.csv':
-            # Intentar diferentes encodings para CSV
-            encodings = ['utf-8', 'latin-1', 'cp1252']
-            
-            for encoding in encodings:
-                try:
-                    return pd.read_csv(file_path, encoding=encoding)
-                except UnicodeDecodeError:
-                    continue
-            
-            raise ValueError("No se pudo decodificar el archivo CSV")
+            # Leer los bytes una vez y parsear solo el texto ya decodificado
+            return pd.read_csv(io.StringIO(self._decode_csv(file_path.read_bytes())))
         
         elif suffix in ['.xlsx', '.xls']:
-            # Para Excel, intentar leer todas las hojas y usar la más grande
+            # Para Excel, usar la hoja con más datos
+            if suffix == '.xlsx':
+                # En modo solo lectura openpyxl da las dimensiones de cada hoja sin parsear sus celdas
+                from openpyxl import load_workbook
+                
+                workbook = load_workbook(file_path, read_only=True, data_only=True)
+                try:
+                    best_sheet = max(workbook.sheetnames, key=lambda name: workbook[name].max_row or 0)
+                finally:
+                    workbook.close()
+                
+                return pd.read_excel(file_path, sheet_name=best_sheet, engine='openpyxl')
+            
+            # .xls no lo soporta openpyxl: abrir el libro una vez y muestrear cada hoja
             excel_file = pd.ExcelFile(file_path)
             
             if len(excel_file.sheet_names) == 1:
-                return pd.read_excel(file_path)
+                return excel_file.parse(0)
             else:
                 # Buscar la hoja con más datos
                 best_sheet = None
@@ -222,7 +229,7 @@ class PriceBookImporter:
                 
                 for sheet_name in excel_file.sheet_names:
                     try:
-                        df_temp = pd.read_excel(file_path, sheet_name=sheet_name, nrows=10)
+                        df_temp = excel_file.parse(sheet_name, nrows=10)
                         if len(df_temp) > max_rows:
                             max_rows = len(df_temp)
                             best_sheet = sheet_name
@@ -230,18 +237,32 @@ class PriceBookImporter:
                         continue
                 
                 if best_sheet:
-                    return pd.read_excel(file_path, sheet_name=best_sheet)
+                    return excel_file.parse(best_sheet)
                 else:
                     # Usar la primera hoja como fallback
-                    return pd.read_excel(file_path, sheet_name=0)
+                    return excel_file.parse(0)
         
         else:
             raise ValueError(f"Formato de archivo no soportado: {suffix}")
     
+    def _decode_csv(self, content: bytes) -> str:
+        """
+        Decodifica el contenido de un CSV probando varios encodings en memoria,
+        para que pandas parsee el archivo una sola vez
+        """
+        for encoding in ['utf-8', 'latin-1', 'cp1252']:
+            try:
+                return content.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        
+        raise ValueError("No se pudo decodificar el archivo CSV")
+    
     def _map_columns(self, df_columns: List[str], mapping_overrides: Optional[Dict] = None) -> Dict[str, str]:
         """Mapea las columnas del archivo a las columnas esperadas"""
         mapping = {}
         used_columns = set()
+        mapped_standard = set()
         
         # Aplicar mapeos personalizados primero
         if mapping_overrides:
@@ -249,38 +270,38 @@ class PriceBookImporter:
                 if file_col in df_columns and file_col not in used_columns:
                     mapping[file_col] = standard_col
                     used_columns.add(file_col)
+                    mapped_standard.add(standard_col)
+        
+        # Minúsculas de cada columna calculadas una sola vez, e índice para coincidencias exactas
+        lowered_columns = [(df_col, df_col.lower()) for df_col in df_columns]
+        columns_by_name: Dict[str, List[str]] = {}
+        for df_col, lowered in lowered_columns:
+            columns_by_name.setdefault(lowered, []).append(df_col)
         
         # Buscar coincidencias con los mapeos estándar
-        for standard_col, possible_names in self.column_mappings.items():
-            if standard_col in mapping.values():
+        for standard_col, possible_names in self._lowered_mappings.items():
+            if standard_col in mapped_standard:
                 continue  # Ya mapeado
             
             for possible_name in possible_names:
                 # Buscar coincidencia exacta (case-insensitive)
-                for df_col in df_columns:
-                    if df_col.lower() == possible_name.lower() and df_col not in used_columns:
-                        mapping[df_col] = standard_col
-                        used_columns.add(df_col)
-                        break
+                match = next((df_col for df_col in columns_by_name.get(possible_name, ()) if df_col not in used_columns), None)
                 
-                if standard_col in mapping.values():
-                    break
-                
-                # Buscar coincidencia parcial
-                for df_col in df_columns:
-                    if possible_name.lower() in df_col.lower() and df_col not in used_columns:
-                        # Verificar que no sea una coincidencia ambigua
-                        if len(df_col) < len(possible_name) * 2:  # No demasiado largo
-                            mapping[df_col] = standard_col
-                            used_columns.add(df_col)
-                            break
+                # Buscar coincidencia parcial, descartando columnas demasiado largas (ambiguas)
+                if match is None:
+                    match = next((
+                        df_col for df_col, lowered in lowered_columns
+                        if possible_name in lowered and df_col not in used_columns and len(df_col) < len(possible_name) * 2
+                    ), None)
                 
-                if standard_col in mapping.values():
+                if match is not None:
+                    mapping[match] = standard_col
+                    used_columns.add(match)
+                    mapped_standard.add(standard_col)
                     break
         
         # Verificar que tenemos las columnas requeridas
-        mapped_columns = set(mapping.values())
-        missing_required = [col for col in self.required_columns if col not in mapped_columns]
+        missing_required = [col for col in self.required_columns if col not in mapped_standard]
         
         if missing_required:
             logger.warning(f"Columnas requeridas faltantes: {missing_required}")
@@ -297,25 +318,16 @@ class PriceBookImporter:
         # Limpiar espacios en nombres de columnas
         df_clean.columns = df_clean.columns.str.strip()
         
-        # Limpiar espacios en datos de texto
+        # Limpiar espacios en datos de texto y reemplazar valores vacíos o 'nan' con None
+        # (una sola pasada por columna: la máscara se calcula sobre el texto ya recortado)
         for col in df_clean.select_dtypes(include=['object']).columns:
-            df_clean[col] = df_clean[col].astype(str).str.strip()
-            # Reemplazar valores vacíos o 'nan' con None
-            df_clean[col] = df_clean[col].replace(['', 'nan', 'NaN', 'None'], None)
-        
-        # Convertir precios a formato numérico
-        if 'unit_price' in df_clean.columns:
-            df_clean['unit_price'] = pd.to_numeric(df_clean['unit_price'], errors='coerce')
-        
-        # Convertir porcentajes a formato numérico
-        percentage_columns = ['labor_percentage', 'material_percentage', 'equipment_percentage']
-        for col in percentage_columns:
-            if col in df_clean.columns:
-                df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
+            stripped = df_clean[col].astype(str).str.strip()
+            df_clean[col] = stripped.where(~stripped.isin(self._EMPTY_VALUES), None)
         
-        # Convertir rendimiento a formato numérico
-        if 'performance_rate' in df_clean.columns:
-            df_clean['performance_rate'] = pd.to_numeric(df_clean['performance_rate'], errors='coerce')
+        # Convertir precios, porcentajes y rendimiento a formato numérico en bloque
+        numeric_columns = [col for col in self._NUMERIC_COLUMNS if col in df_clean.columns]
+        if numeric_columns:
+            df_clean[numeric_columns] = df_clean[numeric_columns].apply(pd.to_numeric, errors='coerce')
         
         # Eliminar filas donde código y descripción sean nulos
         if 'code' in df_clean.columns and 'description' in df_clean.columns:
@@ -365,32 +377,32 @@ class PriceBookImporter:
         
         # Validar códigos únicos
         if rules.get('unique_codes') and 'code' in df.columns:
-            duplicate_codes = df[df.duplicated(subset=['code'], keep=False)]['code'].tolist()
-            if duplicate_codes:
+            duplicate_mask = df['code'].duplicated(keep=False)
+            if duplicate_mask.any():
+                duplicate_codes = df['code'][duplicate_mask].tolist()
                 warnings.append(f"Códigos duplicados encontrados: {set(duplicate_codes)}")
         
         # Validar rangos de precios
         if 'unit_price' in df.columns:
-            invalid_prices = df[
+            invalid_prices = int((
                 (df['unit_price'] < rules['min_price']) | 
                 (df['unit_price'] > rules['max_price'])
-            ]
-            if len(invalid_prices) > 0:
-                warnings.append(f"{len(invalid_prices)} precios fuera del rango esperado")
+            ).sum())
+            if invalid_prices > 0:
+                warnings.append(f"{invalid_prices} precios fuera del rango esperado")
         
         # Validar unidades
         if 'unit' in df.columns and rules.get('valid_units'):
-            invalid_units = df[~df['unit'].isin(rules['valid_units'])]['unit'].unique()
+            units = df['unit']
+            invalid_units = units[~units.isin(rules['valid_units'])].unique()
             if len(invalid_units) > 0:
                 warnings.append(f"Unidades no reconocidas: {invalid_units}")
         
         # Validar porcentajes
         percentage_columns = ['labor_percentage', 'material_percentage', 'equipment_percentage']
         for col in percentage_columns:
-            if col in df.columns:
-                invalid_percentages = df[(df[col] < 0) | (df[col] > 100)][col].tolist()
-                if invalid_percentages:
-                    warnings.append(f"{col} con valores fuera del rango 0-100%")
+            if col in df.columns and ((df[col] < 0) | (df[col] > 100)).any():
+                warnings.append(f"{col} con valores fuera del rango 0-100%")
         
         return {
             'is_valid': len(errors) == 0,
@@ -400,52 +412,62 @@ class PriceBookImporter:
     
     def _convert_to_entries(self, df: pd.DataFrame, price_book_id: int) -> List[Dict[str, Any]]:
         """Convierte el DataFrame a entradas de libro de precios"""
-        entries = []
-        
-        for _, row in df.iterrows():
-            entry = {
-                'price_book_id': price_book_id,
-                'code': str(row.get('code', '')).strip(),
-                'description': str(row.get('description', '')).strip(),
-                'unit': str(row.get('unit', 'un')).strip(),
-                'unit_price': float(row.get('unit_price', 0)),
-                'labor_percentage': float(row.get('labor_percentage', 40.0)),
-                'material_percentage': float(row.get('material_percentage', 50.0)),
-                'equipment_percentage': float(row.get('equipment_percentage', 10.0)),
-                'performance_rate': float(row.get('performance_rate', 1.0)),
-                'category': str(row.get('category', 'General')).strip(),
-                'notes': str(row.get('notes', '')).strip() if pd.notna(row.get('notes')) else '',
-                'is_active': True
-            }
-            
-            # Validar entrada mínima
-            if entry['code'] and entry['description'] and entry['unit_price'] > 0:
-                entries.append(entry)
-        
-        return entries
+        def text_column(name: str, default: str) -> pd.Series:
+            if name not in df.columns:
+                return pd.Series(default, index=df.index, dtype=object)
+            return df[name].astype(str).str.strip()
+        
+        def number_column(name: str, default: float) -> pd.Series:
+            if name not in df.columns:
+                return pd.Series(default, index=df.index, dtype=np.float64)
+            return df[name].astype(np.float64)
+        
+        # Convertir cada columna de una vez en lugar de fila por fila
+        if 'notes' in df.columns:
+            notes = df['notes'].astype(str).str.strip().where(df['notes'].notna(), '')
+        else:
+            notes = text_column('notes', '')
+        
+        entries_df = pd.DataFrame({
+            'price_book_id': price_book_id,
+            'code': text_column('code', ''),
+            'description': text_column('description', ''),
+            'unit': text_column('unit', 'un'),
+            'unit_price': number_column('unit_price', 0.0),
+            'labor_percentage': number_column('labor_percentage', 40.0),
+            'material_percentage': number_column('material_percentage', 50.0),
+            'equipment_percentage': number_column('equipment_percentage', 10.0),
+            'performance_rate': number_column('performance_rate', 1.0),
+            'category': text_column('category', 'General'),
+            'notes': notes,
+            'is_active': True
+        }, index=df.index)
+        
+        # Validar entrada mínima
+        valid = (entries_df['code'] != '') & (entries_df['description'] != '') & (entries_df['unit_price'] > 0)
+        
+        return entries_df[valid].to_dict(orient='records')
     
     def _calculate_price_range(self, entries: List[Dict[str, Any]]) -> Dict[str, float]:
         """Calcula el rango de precios en las entradas"""
         if not entries:
             return {'min': 0, 'max': 0, 'average': 0}
         
-        prices = [entry['unit_price'] for entry in entries]
+        prices = np.fromiter((entry['unit_price'] for entry in entries), dtype=np.float64, count=len(entries))
         
         return {
-            'min': float(min(prices)),
-            'max': float(max(prices)),
-            'average': float(sum(prices) / len(prices))
+            'min': float(prices.min()),
+            'max': float(prices.max()),
+            'average': float(prices.mean())
         }
     
     def _extract_categories(self, entries: List[Dict[str, Any]]) -> List[str]:
         """Extrae las categorías únicas de las entradas"""
-        categories = set(entry.get('category', 'General') for entry in entries)
-        return sorted(list(categories))
+        return sorted({entry.get('category', 'General') for entry in entries})
     
     def _extract_units(self, entries: List[Dict[str, Any]]) -> List[str]:
         """Extrae las unidades únicas de las entradas"""
-        units = set(entry.get('unit', 'un') for entry in entries)
-        return sorted(list(units))
+        return sorted({entry.get('unit', 'un') for entry in entries})
     
     def export_template(self, output_path: str, format_type: str = 'xlsx') -> bool:
         """
@@ -459,7 +481,7 @@ class PriceBookImporter:
             True si se exportó exitosamente
         """
         try:
-            # Crear DataFrame de ejemplo
+            # Datos de ejemplo por columna
             template_data = {
                 'code': ['01.01.01', '01.01.02', '01.02.01', '02.01.01'],
                 'description': [
@@ -483,8 +505,6 @@ class PriceBookImporter:
                 ]
             }
             
-            df_template = pd.DataFrame(template_data)
-            
             # Agregar fila de encabezados descriptivos
             header_row = {
                 'code': 'Código de partida (formato: XX.XX.XX)',
@@ -499,46 +519,63 @@ class PriceBookImporter:
                 'notes': 'Notas adicionales o especificaciones'
             }
             
-            df_header = pd.DataFrame([header_row])
-            df_final = pd.concat([df_header, df_template], ignore_index=True)
+            # Filas en el orden final: nombres de columna, descripciones y ejemplos
+            columns = list(template_data)
+            rows = [[header_row[col] for col in columns], *zip(*template_data.values())]
             
-            # Exportar según formato
+            # Exportar según formato, escribiendo las filas directamente sin pasar por DataFrames
             if format_type.lower() == 'xlsx':
-                with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
-                    df_final.to_excel(writer, sheet_name='Libro_Precios', index=False)
-                    
-                    # Obtener la hoja de trabajo para formateo
-                    worksheet = writer.sheets['Libro_Precios']
-                    
-                    # Formatear encabezados
-                    from openpyxl.styles import Font, PatternFill
-                    
-                    header_font = Font(bold=True, color='FFFFFF')
-                    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-                    
-                    for cell in worksheet[1]:
-                        cell.font = header_font
-                        cell.fill = header_fill
-                    
-                    # Ajustar anchos de columna
-                    column_widths = {
-                        'A': 15,  # code
-                        'B': 50,  # description
-                        'C': 12,  # unit
-                        'D': 15,  # unit_price
-                        'E': 20,  # category
-                        'F': 18,  # labor_percentage
-                        'G': 20,  # material_percentage
-                        'H': 20,  # equipment_percentage
-                        'I': 18,  # performance_rate
-                        'J': 40   # notes
-                    }
-                    
-                    for col, width in column_widths.items():
-                        worksheet.column_dimensions[col].width = width
+                from openpyxl import Workbook
+                from openpyxl.cell import WriteOnlyCell
+                from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+                
+                workbook = Workbook(write_only=True)
+                worksheet = workbook.create_sheet('Libro_Precios')
+                
+                # Ajustar anchos de columna (en modo write-only, antes de escribir filas)
+                column_widths = {
+                    'A': 15,  # code
+                    'B': 50,  # description
+                    'C': 12,  # unit
+                    'D': 15,  # unit_price
+                    'E': 20,  # category
+                    'F': 18,  # labor_percentage
+                    'G': 20,  # material_percentage
+                    'H': 20,  # equipment_percentage
+                    'I': 18,  # performance_rate
+                    'J': 40   # notes
+                }
+                
+                for col, width in column_widths.items():
+                    worksheet.column_dimensions[col].width = width
+                
+                # Formatear encabezados
+                header_font = Font(bold=True, color='FFFFFF')
+                header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+                thin = Side(style='thin')
+                header_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+                header_alignment = Alignment(horizontal='center', vertical='top')
+                
+                header_cells = []
+                for col in columns:
+                    cell = WriteOnlyCell(worksheet, value=col)
+                    cell.font = header_font
+                    cell.fill = header_fill
+                    cell.border = header_border
+                    cell.alignment = header_alignment
+                    header_cells.append(cell)
+                
+                worksheet.append(header_cells)
+                for row in rows:
+                    worksheet.append(row)
+                
+                workbook.save(output_path)
             
             elif format_type.lower() == 'csv':
-                df_final.to_csv(output_path, index=False, encoding='utf-8')
+                with open(output_path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f, lineterminator='\n')
+                    writer.writerow(columns)
+                    writer.writerows(rows)
             
             else:
                 raise ValueError(f"Formato de exportación no soportado: {format_type}")